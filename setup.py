@@ -32,6 +32,8 @@ setup(
     [console_scripts]
     flask-ctl = presence_analyzer.script:run
     get-users-data = presence_analyzer.script:get_users_data
+    load-test = presence_analyzer.loadtest:run
+    benchmark = presence_analyzer.benchmarks:run
 
     [paste.app_factory]
     main = presence_analyzer.script:make_app
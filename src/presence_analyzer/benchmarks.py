@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of data loading.
+"""
+# pylint:skip-file
+
+import os
+import bz2
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable=C0103
+
+DROP_CACHES = '/proc/sys/vm/drop_caches'
+
+# Every bin/flask-ctl command (cron driven refresh_users, cache and export
+# commands) and every server start imports the application, so importing
+# it must stay cheap and must not pull in modules used only by commands
+# or rarely used data formats. Paste recycles threads, not processes,
+# so serving requests does not pay it again.
+IMPORT_TIME_BUDGET = 0.5
+# Tests compare with importing Flask in the same environment, which keeps
+# them independent of machine speed and load; application modules may
+# take at most IMPORT_BASELINE_FACTOR times as long.
+IMPORT_BASELINE = 'flask'
+IMPORT_BASELINE_FACTOR = 1.5
+IMPORT_MODULES = ['presence_analyzer', 'presence_analyzer.script']
+DEFERRED_MODULES = ['lxml', 'requests', 'paste.script', 'werkzeug.script',
+                    'gzip', 'bz2']
+
+# Runs in a fresh interpreter; records cumulative time of every import
+# statement which loaded new modules, in completion order like
+# python3 -X importtime does.
+IMPORT_TIMER = """
+import sys, time, json, __builtin__
+original = __builtin__.__import__
+records = []
+depth = [0]
+
+def timed_import(name, *args, **kwargs):
+    loaded = len(sys.modules)
+    depth[0] += 1
+    started = time.time()
+    try:
+        return original(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - started
+        depth[0] -= 1
+        if len(sys.modules) != loaded:
+            records.append((depth[0], name, elapsed))
+
+__builtin__.__import__ = timed_import
+started = time.time()
+__import__(sys.argv[1])
+total = time.time() - started
+__builtin__.__import__ = original
+json.dump({
+    'total': total,
+    'imports': records,
+    'modules': sorted(sys.modules),
+}, sys.stdout)
+"""
+
+
+def compress(path, workdir):
+    """
+    Writes plain and compressed copies of given file to workdir.
+
+    Returns list of (format, path) tuples.
+    """
+    from presence_analyzer.utils import get_lzma
+
+    lzma = get_lzma()
+    with open(path, 'rb') as handle:
+        content = handle.read()
+    name = os.path.basename(path)
+    copies = [('plain', os.path.join(workdir, name))]
+    shutil.copy(path, copies[0][1])
+
+    copies.append(('gzip', os.path.join(workdir, name + '.gz')))
+    handle = gzip.open(copies[-1][1], 'wb')
+    handle.write(content)
+    handle.close()
+
+    copies.append(('bz2', os.path.join(workdir, name + '.bz2')))
+    handle = bz2.BZ2File(copies[-1][1], 'w')
+    handle.write(content)
+    handle.close()
+
+    if lzma is not None:
+        copies.append(('xz', os.path.join(workdir, name + '.xz')))
+        handle = lzma.LZMAFile(copies[-1][1], 'w')
+        handle.write(content)
+        handle.close()
+    else:
+        log.warning('lzma module not available, skipping xz')
+    return copies
+
+
+def drop_page_cache():
+    """
+    Asks the kernel to drop page cache. Returns False when not permitted.
+    """
+    try:
+        os.system('sync')
+        with open(DROP_CACHES, 'w') as handle:
+            handle.write('3\n')
+    except IOError:
+        return False
+    return True
+
+
+def time_load(path, repeat=3):
+    """
+    Returns best time of parsing given presence data file.
+    """
+    from presence_analyzer.utils import parse_presence_csv
+
+    best = None
+    for _ in range(repeat):
+        started = time.time()
+        parse_presence_csv(path)
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_compression(path, repeat=3, stream=sys.stdout):
+    """
+    Compares load time of plain and compressed presence data.
+
+    Cold cache timings need permission to drop page cache (root),
+    otherwise they are reported as n/a.
+    """
+    workdir = tempfile.mkdtemp(prefix='presence-benchmark-')
+    results = []
+    try:
+        for name, copy in compress(path, workdir):
+            cold = None
+            if drop_page_cache():
+                cold = time_load(copy, repeat=1)
+            warm = time_load(copy, repeat)
+            results.append((name, os.path.getsize(copy), cold, warm))
+    finally:
+        shutil.rmtree(workdir)
+
+    stream.write('{0:<8}{1:>12}{2:>12}{3:>12}\n'.format(
+        'format', 'size (B)', 'cold (s)', 'warm (s)'
+    ))
+    for name, size, cold, warm in results:
+        stream.write('{0:<8}{1:>12}{2:>12}{3:>12.3f}\n'.format(
+            name, size, 'n/a' if cold is None else '{0:.3f}'.format(cold),
+            warm
+        ))
+    return results
+
+
+def measure_imports(module, python=sys.executable):
+    """
+    Measures importing given module in a fresh interpreter.
+
+    Returns dictionary with total time, list of (depth, name, cumulative
+    time) of imports in completion order and names of loaded modules.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output(
+        [python, '-c', IMPORT_TIMER, module], env=env
+    )
+    return json.loads(output)
+
+
+def deferred_loaded(modules):
+    """
+    Lists modules which should be deferred but were loaded.
+    """
+    return sorted(
+        name for name in DEFERRED_MODULES
+        if name in modules or
+        any(loaded.startswith(name + '.') for loaded in modules)
+    )
+
+
+def benchmark_imports(modules=IMPORT_MODULES, limit=15, stream=sys.stdout):
+    """
+    Reports import time of application modules and their slowest imports.
+    """
+    results = {}
+    for module in modules:
+        result = results[module] = measure_imports(module)
+        stream.write('{0}: {1:.3f} s, {2} modules, budget {3:.3f} s\n'.format(
+            module, result['total'], len(result['modules']),
+            IMPORT_TIME_BUDGET
+        ))
+        slowest = sorted(
+            result['imports'], key=lambda record: record[2], reverse=True
+        )[:limit]
+        for depth, name, elapsed in slowest:
+            stream.write('  {0:>10.1f} ms | {1}{2}\n'.format(
+                elapsed * 1000, '  ' * depth, name
+            ))
+        loaded = deferred_loaded(result['modules'])
+        if loaded:
+            stream.write('  deferred modules loaded: {0}\n'.format(
+                ', '.join(loaded)
+            ))
+    return results
+
+
+# bin/benchmark ...
+def run(argv=None):
+    """
+    Command line entry point of benchmarks.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    commands = parser.add_subparsers(dest='command')
+
+    compression = commands.add_parser(
+        'compression', help='compare plain and compressed data load time'
+    )
+    compression.add_argument('path', help='presence data CSV file')
+    compression.add_argument('--repeat', type=int, default=3)
+
+    imports = commands.add_parser(
+        'imports', help='report import time of application modules'
+    )
+    imports.add_argument('modules', nargs='*', default=IMPORT_MODULES)
+    imports.add_argument('--limit', type=int, default=15)
+
+    options = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if options.command == 'compression':
+        benchmark_compression(options.path, options.repeat)
+    elif options.command == 'imports':
+        benchmark_imports(options.modules, options.limit)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Static export of pages and API responses.
+"""
+
+import os
+import time
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from presence_analyzer.utils import get_data, get_groups, ORGANIZATION_GROUP
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable=C0103
+
+PAGES = [
+    '/',
+    '/mean_time_weekday',
+    '/presence_start_end',
+    '/occupancy',
+    '/presence_calendar',
+]
+
+API = [
+    '/api/v1/users',
+    '/api/v1/groups',
+    '/api/v1/occupancy',
+    '/api/v1/presence_stats',
+    '/api/v1/start_end_stats',
+]
+
+USER_API = [
+    '/api/v1/mean_time_weekday/{0}',
+    '/api/v1/presence_weekday/{0}',
+    '/api/v1/presence_start_end/{0}',
+    '/api/v1/presence_stats/{0}',
+    '/api/v1/start_end_stats/{0}',
+    '/api/v1/presence_calendar/{0}',
+    '/api/v1/charts/mean_time_weekday/{0}',
+    '/api/v1/charts/presence_start_end/{0}',
+]
+
+GROUP_API = [
+    '/api/v1/groups/{0}/mean_time_weekday',
+    '/api/v1/groups/{0}/presence_weekday',
+    '/api/v1/groups/{0}/presence_start_end',
+]
+
+# Lists files written by the previous export; only those are ever removed.
+MANIFEST_NAME = '.presence-export'
+
+
+def export_urls():
+    """
+    Lists URLs of all exported pages and API responses.
+    """
+    urls = PAGES + API
+    for user_id in sorted(get_data()):
+        urls.extend(url.format(user_id) for url in USER_API)
+    for group in [ORGANIZATION_GROUP] + sorted(get_groups()):
+        urls.extend(url.format(group) for url in GROUP_API)
+    return urls
+
+
+def export_path(directory, url):
+    """
+    Maps URL to exported file path.
+
+    Pages are exported as index.html of their directory, API responses
+    as .json files, e.g. /api/v1/users becomes api/v1/users.json.
+    """
+    parts = [part for part in url.split('/') if part]
+    if url.startswith('/api/'):
+        parts[-1] += '.json'
+    else:
+        parts.append('index.html')
+    return os.path.join(directory, *parts)
+
+
+def write_if_changed(path, content):
+    """
+    Atomically writes content to path unless it already has it.
+
+    Returns True if the file was written.
+    """
+    try:
+        with open(path, 'rb') as handle:
+            if handle.read() == content:
+                return False
+    except IOError:
+        pass
+
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname)
+    except OSError:
+        if not os.path.isdir(dirname):
+            raise
+    handle = tempfile.NamedTemporaryFile(
+        dir=dirname, prefix='.' + os.path.basename(path), delete=False
+    )
+    with handle:
+        handle.write(content)
+    os.chmod(handle.name, 0o644)
+    os.rename(handle.name, path)
+    return True
+
+
+def read_manifest(directory):
+    """
+    Reads paths, relative to directory, written by the previous export.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'rb') as handle:
+            return set(line for line in handle.read().splitlines() if line)
+    except IOError:
+        return set()
+
+
+def render(app, url):
+    """
+    Renders given URL with the application.
+    """
+    response = app.test_client().get(url)
+    if response.status_code != 200:
+        raise ValueError(
+            'Rendering {0} failed with status {1}'.format(
+                url, response.status_code
+            )
+        )
+    return response.data
+
+
+def export(app, directory, workers=8):
+    """
+    Renders all pages and API responses into directory in parallel.
+
+    Only files whose content changed are written; files written by
+    the previous export which are no longer produced are removed, other
+    files in directory are left alone.
+    Returns dictionary with counts of written, unchanged and removed files
+    and elapsed time.
+    """
+    started = time.time()
+    urls = export_urls()
+
+    def export_url(url):
+        """
+        Renders and writes single URL.
+        """
+        return write_if_changed(export_path(directory, url), render(app, url))
+
+    pool = ThreadPool(workers)
+    try:
+        written = pool.map(export_url, urls)
+    finally:
+        pool.close()
+        pool.join()
+
+    exported = set(
+        os.path.relpath(export_path(directory, url), directory)
+        for url in urls
+    )
+    removed = 0
+    for name in sorted(read_manifest(directory) - exported):
+        if os.path.isabs(name) or name.split(os.sep)[0] == os.pardir:
+            log.warning('Ignoring %s listed in export manifest', name)
+            continue
+        path = os.path.join(directory, name)
+        try:
+            os.unlink(path)
+        except OSError:
+            if os.path.exists(path):
+                raise
+        else:
+            removed += 1
+    write_if_changed(
+        os.path.join(directory, MANIFEST_NAME),
+        ''.join(name + '\n' for name in sorted(exported))
+    )
+
+    result = {
+        'written': sum(written),
+        'unchanged': len(written) - sum(written),
+        'removed': removed,
+        'elapsed': time.time() - started,
+    }
+    log.info(
+        'Exported %(written)d changed, %(unchanged)d unchanged, '
+        '%(removed)d removed files in %(elapsed).2f s', result
+    )
+    return result
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+"""
+Load-testing harness.
+
+Generates synthetic presence data and users feed, serves the feed from
+a local stand-in of the intranet server, boots the application and replays
+a mix of page and API requests against it.
+"""
+# pylint:skip-file
+
+import os
+import csv
+import sys
+import math
+import time
+import random
+import hashlib
+import shutil
+import argparse
+import datetime
+import email.utils
+import tempfile
+import threading
+import BaseHTTPServer
+import SocketServer
+
+import requests
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable=C0103
+
+MENU_CSV = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'runtime', 'data', 'menu_data.csv'
+)
+
+# (weight, url template) - share of page views vs. API calls made by
+# the frontend, with the query arguments the pages send; API calls are
+# issued once per user selection, occupancy also once per page view.
+REQUEST_MIX = [
+    (5, '/'),
+    (3, '/mean_time_weekday'),
+    (2, '/presence_start_end'),
+    (2, '/occupancy'),
+    (2, '/presence_calendar'),
+    (25, '/api/v1/presence_weekday/{user_id}'),
+    (20, '/api/v1/charts/mean_time_weekday/{user_id}'),
+    (15, '/api/v1/charts/presence_start_end/{user_id}'),
+    (6, '/api/v1/occupancy?resolution=900'),
+    (4, '/api/v1/occupancy?resolution=900&user_id={user_id}'),
+    (10, '/api/v1/charts/presence_calendar/{user_id}?resolution=392'),
+]
+
+
+def generate_presence_csv(path, users=100, days=365, seed=0,
+                          first_day=datetime.date(2013, 1, 1)):
+    """
+    Writes synthetic presence CSV for given number of users and days.
+
+    Weekends are skipped and every user is absent on some days.
+    Returns list of generated user ids.
+    """
+    rand = random.Random(seed)
+    user_ids = range(10, 10 + users)
+    with open(path, 'wb') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',')
+        for day in xrange(days):
+            date = first_day + datetime.timedelta(days=day)
+            if date.weekday() > 4:
+                continue
+            for user_id in user_ids:
+                if rand.random() < 0.1:
+                    continue
+                start = int(rand.gauss(9 * 3600, 1800))
+                end = start + int(rand.gauss(8 * 3600, 3600))
+                start = min(max(start, 0), 86399)
+                end = min(max(end, start), 86399)
+                writer.writerow([
+                    user_id,
+                    date.strftime('%Y-%m-%d'),
+                    '{0:02d}:{1:02d}:{2:02d}'.format(*_split_time(start)),
+                    '{0:02d}:{1:02d}:{2:02d}'.format(*_split_time(end)),
+                ])
+    return user_ids
+
+
+def _split_time(seconds):
+    """
+    Splits amount of seconds since midnight into hours, minutes, seconds.
+    """
+    return seconds // 3600, seconds % 3600 // 60, seconds % 60
+
+
+def generate_users_xml(path, user_ids):
+    """
+    Writes synthetic users.xml in the intranet feed format.
+    """
+    with open(path, 'wb') as handle:
+        handle.write(
+            '<?xml version="1.0" encoding="UTF-8" ?>\n'
+            '<intranet>\n'
+            '    <server>\n'
+            '        <host>localhost</host>\n'
+            '        <port>443</port>\n'
+            '        <protocol>https</protocol>\n'
+            '    </server>\n'
+            '    <users>\n'
+        )
+        for user_id in user_ids:
+            handle.write(
+                '        <user id="{0}">\n'
+                '            <avatar>/api/images/users/{0}</avatar>\n'
+                '            <name>User {0}</name>\n'
+                '        </user>\n'.format(user_id)
+            )
+        handle.write('    </users>\n</intranet>\n')
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    """
+    HTTP server handling each request in a separate thread.
+    """
+    daemon_threads = True
+
+
+class _UsersFeedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves users.xml file of the owning UsersFeedServer.
+    """
+
+    def do_GET(self):
+        """
+        Sends users.xml content honouring conditional request headers.
+        """
+        if self.path.split('?')[0] != '/users.xml':
+            self.send_error(404)
+            return
+        self.server.hits += 1
+        with open(self.server.xml_path, 'rb') as handle:
+            content = handle.read()
+        etag = '"{0}"'.format(hashlib.md5(content).hexdigest())
+        last_modified = email.utils.formatdate(
+            int(os.path.getmtime(self.server.xml_path)), usegmt=True
+        )
+        if self._not_modified(etag, last_modified):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _not_modified(self, etag, last_modified):
+        """
+        Checks If-None-Match and If-Modified-Since request headers.
+        """
+        if_none_match = self.headers.getheader('If-None-Match')
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = self.headers.getheader('If-Modified-Since')
+        if if_modified_since is not None:
+            since = email.utils.parsedate_tz(if_modified_since)
+            modified = email.utils.parsedate_tz(last_modified)
+            return (since is not None and
+                    email.utils.mktime_tz(modified) <=
+                    email.utils.mktime_tz(since))
+        return False
+
+    def log_message(self, format, *args):
+        """
+        Routes access log to logging instead of stderr.
+        """
+        log.debug(format, *args)
+
+
+class UsersFeedServer(object):
+    """
+    Local stand-in for the intranet server publishing users.xml.
+    """
+
+    def __init__(self, xml_path, host='127.0.0.1', port=0):
+        self.server = _ThreadingHTTPServer((host, port), _UsersFeedHandler)
+        self.server.xml_path = xml_path
+        self.server.hits = 0
+        self.thread = None
+
+    @property
+    def hits(self):
+        """
+        Number of users.xml requests served so far.
+        """
+        return self.server.hits
+
+    @property
+    def url(self):
+        """
+        URL of served users.xml.
+        """
+        host, port = self.server.server_address
+        return 'http://{0}:{1}/users.xml'.format(host, port)
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    """
+    WSGI request handler routing access log to logging.
+    """
+
+    def log(self, type, message, *args):
+        """
+        Logs on debug level only.
+        """
+        log.debug(message, *args)
+
+
+class AppServer(object):
+    """
+    Threaded WSGI server running the application in background.
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=0):
+        self.server = make_server(
+            host, port, app, threaded=True,
+            request_handler=_QuietRequestHandler,
+        )
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        Base URL of the application.
+        """
+        return 'http://{0}:{1}'.format(
+            self.server.server_address[0], self.server.server_port
+        )
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def build_requests(user_ids, total, seed=0, mix=REQUEST_MIX):
+    """
+    Draws list of request paths following weights of given mix.
+    """
+    rand = random.Random(seed)
+    weights = [weight for weight, _ in mix]
+    cumulative = [sum(weights[:i + 1]) for i in range(len(weights))]
+    paths = []
+    for _ in xrange(total):
+        pick = rand.uniform(0, cumulative[-1])
+        index = next(
+            i for i, bound in enumerate(cumulative) if pick <= bound
+        )
+        paths.append(mix[index][1].format(user_id=rand.choice(user_ids)))
+    return paths
+
+
+def replay(base_url, paths, concurrency=10):
+    """
+    Replays requests using given number of concurrent clients.
+
+    Returns tuple of wall time and list of (path, status, latency) tuples.
+    """
+    pending = list(reversed(paths))
+    lock = threading.Lock()
+    results = []
+
+    def worker():
+        """
+        Issues requests until there are none left.
+        """
+        session = requests.Session()
+        while True:
+            with lock:
+                if not pending:
+                    return
+                path = pending.pop()
+            started = time.time()
+            try:
+                status = session.get(base_url + path).status_code
+            except requests.RequestException:
+                log.debug('Request %s failed', path, exc_info=True)
+                status = None
+            latency = time.time() - started
+            with lock:
+                results.append((path, status, latency))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - started, results
+
+
+def percentile(values, pct):
+    """
+    Calculates percentile of values using nearest-rank method.
+    Returns zero for empty lists.
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+def summarize(wall_time, results):
+    """
+    Calculates throughput, error count and latency percentiles.
+    """
+    latencies = [latency for _, _, latency in results]
+    return {
+        'requests': len(results),
+        'errors': len([1 for _, status, _ in results if status != 200]),
+        'wall_time': wall_time,
+        'throughput': len(results) / wall_time if wall_time else 0,
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies) if latencies else 0,
+    }
+
+
+def print_summary(summary, stream=sys.stdout):
+    """
+    Prints human readable load test report.
+    """
+    stream.write(
+        'requests:   {requests} ({errors} errors)\n'
+        'wall time:  {wall_time:.2f} s\n'
+        'throughput: {throughput:.1f} req/s\n'
+        'latency:    p50 {p50_ms:.1f} ms, p90 {p90_ms:.1f} ms, '
+        'p99 {p99_ms:.1f} ms, max {max_ms:.1f} ms\n'.format(
+            p50_ms=summary['p50'] * 1000,
+            p90_ms=summary['p90'] * 1000,
+            p99_ms=summary['p99'] * 1000,
+            max_ms=summary['max'] * 1000,
+            **summary
+        )
+    )
+
+
+def load_test(users=100, days=365, total=1000, concurrency=10, seed=0,
+              workdir=None):
+    """
+    Runs complete load test and returns its summary.
+    """
+    from presence_analyzer import app
+    from presence_analyzer.script import get_users_data
+
+    cleanup = workdir is None
+    if cleanup:
+        workdir = tempfile.mkdtemp(prefix='presence-loadtest-')
+    feed_path = os.path.join(workdir, 'feed_users.xml')
+    data_csv = os.path.join(workdir, 'data.csv')
+    users_xml = os.path.join(workdir, 'users.xml')
+
+    user_ids = generate_presence_csv(data_csv, users, days, seed)
+    generate_users_xml(feed_path, user_ids)
+
+    feed = UsersFeedServer(feed_path).start()
+    try:
+        get_users_data(url=feed.url, path=users_xml)
+    finally:
+        feed.stop()
+
+    config = {
+        'DATA_CSV': data_csv,
+        'DATA_USERS': users_xml,
+        'MENU_CSV': app.config.get('MENU_CSV', MENU_CSV),
+    }
+    previous = {key: app.config[key] for key in config if key in app.config}
+    app.config.update(config)
+    server = AppServer(app).start()
+    try:
+        paths = build_requests(user_ids, total, seed)
+        wall_time, results = replay(server.url, paths, concurrency)
+    finally:
+        server.stop()
+        for key in config:
+            app.config.pop(key, None)
+        app.config.update(previous)
+        if cleanup:
+            shutil.rmtree(workdir)
+
+    return summarize(wall_time, results)
+
+
+# bin/load-test
+def run(argv=None):
+    """
+    Command line entry point of load test.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None,
+                        help='keep generated files in this directory')
+    options = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    print_summary(load_test(
+        users=options.users,
+        days=options.days,
+        total=options.requests,
+        concurrency=options.concurrency,
+        seed=options.seed,
+        workdir=options.workdir,
+    ))
@@ -4,11 +4,11 @@
 
 import os
 import sys
-import requests
+import json
+import tempfile
+import threading
 from functools import partial
-
-import paste.script.command
-import werkzeug.script
+from contextlib import closing
 
 import logging
 log = logging.getLogger(__name__)  # pylint: disable=C0103
@@ -28,19 +28,133 @@ for i in range(2 + __name__.count('.')):
 abspath = partial(os.path.join, _buildout_path)
 del _buildout_path
 
+USERS_DATA_URL = 'http://sargo.bolt.stxnext.pl/users.xml'
+USERS_DATA_PATH = './runtime/data/users.xml'
+VALIDATORS_SUFFIX = '.validators'
+CHUNK_SIZE = 64 * 1024
+
 
-def get_users_data():
+def get_users_data(url=USERS_DATA_URL, path=USERS_DATA_PATH):
     """
     Imports xml file with users data
     """
-    response = requests.get(
-        'http://sargo.bolt.stxnext.pl/users.xml', stream=True)
+    refresh_users_data(url, path)
+
+
+def _read_validators(path):
+    """
+    Reads ETag and Last-Modified of the last download of given file.
+    """
+    try:
+        with open(path + VALIDATORS_SUFFIX, 'r') as handle:
+            return json.load(handle)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_atomic(path, chunks):
+    """
+    Writes chunks to a temporary file next to path and returns its name.
+    """
+    handle = tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix='.' + os.path.basename(path),
+        delete=False,
+    )
+    try:
+        with handle:
+            for chunk in chunks:
+                handle.write(chunk)
+    except Exception:
+        os.unlink(handle.name)
+        raise
+    return handle.name
 
-    if response.ok:
-        with open('./runtime/data/users.xml', 'wb') as handle:
-            handle.write(response.content)
-    else:
-        log.debug('Imporing users data does not succeed')
+
+def refresh_users_data(url=USERS_DATA_URL, path=USERS_DATA_PATH,
+                       timeout=30):
+    """
+    Downloads users data file if it changed since the last download.
+
+    Uses conditional request, streams the response to a temporary file,
+    checks it parses and atomically renames it into place, so readers
+    never see a partially written file.
+    Returns True if the file was replaced.
+    """
+    import requests
+    from lxml import etree
+
+    headers = {}
+    if os.path.exists(path):
+        validators = _read_validators(path)
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    try:
+        response = requests.get(
+            url, headers=headers, stream=True, timeout=timeout
+        )
+    except requests.RequestException:
+        log.warning('Importing users data failed', exc_info=True)
+        return False
+
+    # streamed response keeps its connection until closed
+    with closing(response):
+        if response.status_code == 304:
+            log.debug('Users data not modified')
+            return False
+        if not response.ok:
+            log.warning(
+                'Importing users data failed with status %s',
+                response.status_code
+            )
+            return False
+
+        try:
+            temp_path = _write_atomic(
+                path, response.iter_content(chunk_size=CHUNK_SIZE)
+            )
+        except (requests.RequestException, IOError):
+            log.warning('Downloading users data failed', exc_info=True)
+            return False
+        validators = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    try:
+        root = etree.parse(temp_path).getroot()
+        if root.find('users') is None:
+            raise ValueError('Missing users element')
+    except (etree.XMLSyntaxError, ValueError):
+        log.warning('Downloaded users data is invalid', exc_info=True)
+        os.unlink(temp_path)
+        return False
+
+    os.chmod(temp_path, 0o644)
+    os.rename(temp_path, path)
+    validators_path = _write_atomic(
+        path + VALIDATORS_SUFFIX, [json.dumps(validators)]
+    )
+    os.rename(validators_path, path + VALIDATORS_SUFFIX)
+    log.info('Users data refreshed')
+    return True
+
+
+def schedule_users_data(interval, url=USERS_DATA_URL, path=USERS_DATA_PATH,
+                        stop=None):
+    """
+    Refreshes users data every interval seconds until stop event is set.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            refresh_users_data(url, path)
+        except Exception:  # pylint: disable=W0703
+            log.exception('Refreshing users data failed')
+        stop.wait(interval)
 
 
 # bin/paster serve parts/etc/deploy.ini
@@ -92,11 +206,31 @@ def _serve(action, debug=False, dry_run=False):
         ]
     sys.argv = argv[:2] + [abspath(config)] + argv[3:]
     # Run the 'paster' command
+    import paste.script.command
     paste.script.command.run()
 
 
+def _admin_request(method, url, path):
+    """Call admin endpoint of the running application and print result.
+
+    Admin endpoints live in the serving process, so cache commands talk
+    to it over HTTP using ADMIN_TOKEN from the deployment configuration.
+    """
+    import requests
+    app = make_app()
+    response = requests.request(
+        method, url.rstrip('/') + path,
+        headers={'X-Admin-Token': app.config.get('ADMIN_TOKEN') or ''},
+    )
+    if not response.ok:
+        print 'Request failed with status {0}'.format(response.status_code)
+        sys.exit(1)
+    print json.dumps(response.json(), indent=2, sort_keys=True)
+
+
 # bin/flask-ctl ...
 def run():
+    import werkzeug.script
 
     # bin/flask-ctl serve [fg|start|stop|restart|status]
     def action_serve(action=('a', 'start'), dry_run=False):
@@ -126,4 +260,56 @@ def run():
         """Stop the application."""
         _serve('stop', dry_run=dry_run)
 
+    # bin/flask-ctl data_quality
+    def action_data_quality():
+        """Print quality report of presence data."""
+        from presence_analyzer.utils import get_quality_report
+        make_app()
+        print json.dumps(get_quality_report(), indent=2, sort_keys=True)
+
+    # bin/flask-ctl export [DIRECTORY] [--workers=N]
+    def action_export(directory=('d', abspath('var', 'export')), workers=8):
+        """Export pages and API responses as static files.
+
+        Only files whose content changed are written, so nginx can serve
+        the export and fall back to the application for misses.
+
+        Options:
+         - 'directory' target directory, var/export by default
+         - '--workers' number of parallel renderers
+        """
+        from presence_analyzer.export import export
+        result = export(make_app(), directory, workers)
+        print '{written} written, {unchanged} unchanged, {removed} removed ' \
+            'in {elapsed:.2f} s'.format(**result)
+
+    # bin/flask-ctl cache_status [--url=URL]
+    def action_cache_status(url=('u', 'http://localhost:8080')):
+        """Print cache state of the running application."""
+        _admin_request('get', url, '/admin/cache')
+
+    # bin/flask-ctl cache_reload [--url=URL]
+    def action_cache_reload(url=('u', 'http://localhost:8080')):
+        """Reload presence data, users.xml and menu of the running
+        application without restarting it."""
+        _admin_request('post', url, '/admin/cache/reload')
+
+    # bin/flask-ctl cache_flush [--url=URL]
+    def action_cache_flush(url=('u', 'http://localhost:8080')):
+        """Drop caches of the running application."""
+        _admin_request('post', url, '/admin/cache/flush')
+
+    # bin/flask-ctl refresh_users [--interval=SECONDS]
+    def action_refresh_users(url=USERS_DATA_URL, path=USERS_DATA_PATH,
+                             interval=0):
+        """Refresh users.xml if it changed on the intranet server.
+
+        Options:
+         - '--interval' repeat refreshing every given number of seconds
+        """
+        if interval > 0:
+            schedule_users_data(interval, url, path)
+        else:
+            refresh_users_data(url, path)
+
     werkzeug.script.run()
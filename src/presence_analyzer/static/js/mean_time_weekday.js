@@ -1,9 +1,3 @@
-function parseInterval(value) {
-    var result = new Date(1,1,1);
-    result.setMilliseconds(value*1000);
-    return result;
-}
-
 (function($) {
     $(document).ready(function(){
         var loading = $('#loading');
@@ -13,22 +7,12 @@ function parseInterval(value) {
             if(selected_user) {
                 loading.show();
                 chart_div.hide();
-                $.getJSON("/api/v1/mean_time_weekday/"+selected_user, function(result) {
-                    $.each(result, function(index, value) {
-                        value[1] = parseInterval(value[1]);
-                    });
-
-                    var data = new google.visualization.DataTable();
-                    data.addColumn('string', 'Weekday');
-                    data.addColumn('datetime', 'Mean time (h:m:s)');
-                    data.addRows(result);
+                $.getJSON("/api/v1/charts/mean_time_weekday/"+selected_user, function(result) {
+                    var data = new google.visualization.DataTable(result);
                     var options = {
                         hAxis: {title: 'Weekday'}
                     };
-                    var formatter = new google.visualization.DateFormat({pattern: 'HH:mm:ss'});
-                    formatter.format(data, 1);
 
-                    
                     chart_div.show();
                     loading.hide();
                     var chart = new google.visualization.ColumnChart(chart_div[0]);
@@ -37,4 +21,4 @@ function parseInterval(value) {
             }
         });
     });
-        })(jQuery);
\ No newline at end of file
+})(jQuery);
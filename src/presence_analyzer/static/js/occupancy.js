@@ -0,0 +1,36 @@
+google.load("visualization", "1", {packages:["corechart"], 'language': 'en'});
+
+(function($) {
+    $(document).ready(function(){
+        var loading = $('#loading');
+        var chart_div = $('#chart_div');
+
+        function draw(selected_user) {
+            // no more rows than the chart has pixels to draw them
+            var url = "/api/v1/occupancy?resolution=" + chart_div.width();
+            if(selected_user) {
+                url += "&user_id=" + selected_user;
+            }
+            loading.show();
+            chart_div.hide();
+            $.getJSON(url, function(result) {
+                var data = google.visualization.arrayToDataTable(result);
+                var options = {
+                    hAxis: {title: 'Time', showTextEvery: 8},
+                    vAxis: {title: 'Present users'}
+                };
+                chart_div.show();
+                loading.hide();
+                var chart = new google.visualization.LineChart(chart_div[0]);
+                chart.draw(data, options);
+            });
+        }
+
+        $('#user_id').change(function(){
+            draw($("#user_id").val());
+        });
+        google.setOnLoadCallback(function() {
+            draw();
+        });
+    });
+})(jQuery);
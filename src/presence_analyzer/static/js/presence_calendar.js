@@ -0,0 +1,35 @@
+google.load("visualization", "1", {packages:["calendar", "corechart"], 'language': 'en'});
+
+(function($) {
+    $(document).ready(function(){
+        var loading = $('#loading');
+        $('#user_id').change(function(){
+            var selected_user = $("#user_id").val();
+            var chart_div = $('#chart_div');
+            if(selected_user) {
+                // calendar draws a week per 16 px column; longer ranges
+                // are summed by week or month and drawn as columns
+                var resolution = Math.floor(chart_div.width() / 16) * 7;
+                loading.show();
+                chart_div.hide();
+                $.getJSON("/api/v1/charts/presence_calendar/"+selected_user+"?resolution="+resolution, function(result) {
+                    var data = new google.visualization.DataTable(result),
+                        chart;
+
+                    chart_div.show();
+                    loading.hide();
+                    if(data.getTableProperty('bucket') == 'day') {
+                        chart = new google.visualization.Calendar(chart_div[0]);
+                        chart.draw(data, {});
+                    } else {
+                        chart = new google.visualization.ColumnChart(chart_div[0]);
+                        chart.draw(data, {
+                            legend: {position: 'none'},
+                            vAxis: {title: 'Minutes per ' + data.getTableProperty('bucket')}
+                        });
+                    }
+                });
+            }
+        });
+    });
+})(jQuery);
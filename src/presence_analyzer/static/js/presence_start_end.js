@@ -8,28 +8,11 @@
                 loading.show();
                 chart_div.hide();
                 
-                $.getJSON("/api/v1/presence_start_end/"+selected_user, function(result) {
-                        for (var i = 0; i < result.length; i++) {
-                            var start_date = new Date(1, 1, 1),
-                                end_date = new Date(1, 1, 1);
-
-                            start_date.setSeconds(result[i][1]);
-                            end_date.setSeconds(result[i][2]);
-                            result[i][1] = start_date;
-                            result[i][2] = end_date;
-                        }
-
-                        var data = new google.visualization.DataTable();
-                        data.addColumn('string', 'Weekday');
-                        data.addColumn({ type: 'datetime', id: 'Start' });
-                        data.addColumn({ type: 'datetime', id: 'End' });
-                        data.addRows(result);
+                $.getJSON("/api/v1/charts/presence_start_end/"+selected_user, function(result) {
+                        var data = new google.visualization.DataTable(result);
                         var options = {
                             hAxis: {title: 'Weekday'}
                         };
-                        var formatter = new google.visualization.DateFormat({pattern: 'HH:mm:ss'});
-                        formatter.format(data, 1);
-                        formatter.format(data, 2);
 
                         chart_div.show();
                         loading.hide();
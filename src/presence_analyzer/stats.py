@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Single-pass, mergeable statistics.
+"""
+
+import math
+
+
+class RunningStats(object):
+    """
+    Count, mean and variance maintained with Welford's algorithm.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        """
+        Adds single value.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """
+        Adds all values of other stats (Chan's parallel algorithm).
+        """
+        count = self.count + other.count
+        if not count:
+            return self
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        """
+        Population variance. Returns zero for no values.
+        """
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def stddev(self):
+        """
+        Population standard deviation. Returns zero for no values.
+        """
+        return math.sqrt(self.variance)
+
+
+class QuantileSketch(object):
+    """
+    Fixed-resolution histogram answering quantile queries.
+
+    Values are grouped into bins of given width; every bin keeps count and
+    sum of its values, so quantiles are exact when a bin holds a single
+    distinct value and off by less than resolution otherwise. Memory is
+    bounded by the value range, not by the number of values.
+    """
+
+    def __init__(self, resolution=60):
+        self.resolution = resolution
+        self.bins = {}
+
+    def add(self, value):
+        """
+        Adds single value.
+        """
+        counts = self.bins.setdefault(value // self.resolution, [0, 0])
+        counts[0] += 1
+        counts[1] += value
+
+    def merge(self, other):
+        """
+        Adds all values of other sketch of the same resolution.
+        """
+        if other.resolution != self.resolution:
+            raise ValueError('Cannot merge sketches of different resolution')
+        for index, (count, total) in other.bins.items():
+            counts = self.bins.setdefault(index, [0, 0])
+            counts[0] += count
+            counts[1] += total
+        return self
+
+    @property
+    def count(self):
+        """
+        Number of added values.
+        """
+        return sum(count for count, _ in self.bins.values())
+
+    def quantile(self, fraction):
+        """
+        Calculates nearest-rank quantile. Returns zero for no values.
+        """
+        count = self.count
+        if not count:
+            return 0
+        rank = max(int(math.ceil(fraction * count)), 1)
+        seen = 0
+        for index in sorted(self.bins):
+            bin_count, total = self.bins[index]
+            seen += bin_count
+            if seen >= rank:
+                return float(total) / bin_count
+
+
+class Distribution(object):
+    """
+    Running moments and quantile sketch of the same values.
+    """
+
+    def __init__(self, resolution=60):
+        self.stats = RunningStats()
+        self.sketch = QuantileSketch(resolution)
+
+    def add(self, value):
+        """
+        Adds single value.
+        """
+        self.stats.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        """
+        Adds all values of other distribution.
+        """
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self):
+        """
+        Returns dictionary of distribution statistics.
+        """
+        return {
+            'count': self.stats.count,
+            'mean': self.stats.mean,
+            'stddev': self.stats.stddev,
+            'p10': self.sketch.quantile(0.1),
+            'median': self.sketch.quantile(0.5),
+            'p90': self.sketch.quantile(0.9),
+        }
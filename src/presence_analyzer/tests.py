@@ -3,12 +3,26 @@
 Presence analyzer unit tests.
 """
 import os.path
+import sys
+import math
+import csv
 import json
+import time
+import gzip
+import random
+import shutil
+import calendar
 import datetime
+import tempfile
 import unittest
+import threading
+from StringIO import StringIO
+import requests
 from mock import patch
+from werkzeug.exceptions import HTTPException
 
-from presence_analyzer import main, utils, views
+from presence_analyzer import (
+    main, utils, views, script, loadtest, stats, benchmarks, export)
 
 
 TEST_DATA_CSV = os.path.join(
@@ -33,6 +47,15 @@ TEST_MENU_CSV = os.path.join(
     'test_menu_data.csv'
 )
 
+TEST_DATA_GROUPS = os.path.join(
+    os.path.dirname(__file__),
+    '..',
+    '..',
+    'runtime',
+    'data',
+    'test_groups.csv'
+)
+
 TEST_DATA_USERS = os.path.join(
     os.path.dirname(__file__),
     '..',
@@ -54,6 +77,11 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
         Before each test, set up a environment.
         """
         main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_GROUPS': TEST_DATA_GROUPS})
+        main.app.config.update({'DATA_USERS': TEST_DATA_USERS})
+        main.app.config.update({'MENU_CSV': TEST_MENU_CSV})
+        main.app.config.update({'ADMIN_TOKEN': 'secret'})
+        self.admin = {'X-Admin-Token': 'secret'}
         self.client = main.app.test_client()
 
     def tearDown(self):
@@ -154,6 +182,371 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
         self.assertEqual(resp.content_type, 'application/json')
         mocked_log.debug.assert_called_with('User %s not found!', 1)
 
+    def test_occupancy_page(self):
+        """
+        Test occupancy page.
+        """
+        resp = self.client.get('/occupancy')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'text/html; charset=utf-8')
+
+    def test_occupancy_view(self):
+        """
+        Test occupancy view.
+        """
+        resp = self.client.get('/api/v1/occupancy')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 97)
+        self.assertEqual(
+            data[0],
+            [u'Time', u'Mon', u'Tue', u'Wed', u'Thu', u'Fri', u'Sat', u'Sun']
+        )
+        self.assertEqual(data[38], [u'09:15', 1, 1, 2, 0.5, 0, 0, 0])
+        self.assertEqual(data[44], [u'10:45', 1, 2, 2, 1.5, 0, 0, 0])
+
+    def test_occupancy_view_users(self):
+        """
+        Test occupancy view limited to given users.
+        """
+        resp = self.client.get('/api/v1/occupancy?user_id=10&user_id=1')
+        data = json.loads(resp.data)
+        self.assertEqual(data[38], [u'09:15', 0, 0, 1, 0, 0, 0, 0])
+        self.assertEqual(data[44], [u'10:45', 0, 1, 1, 1, 0, 0, 0])
+
+    def test_occupancy_view_resolution(self):
+        """
+        Test occupancy view averages adjacent slots to given resolution.
+        """
+        full = json.loads(self.client.get('/api/v1/occupancy').data)
+        resp = self.client.get('/api/v1/occupancy?resolution=24')
+        data = json.loads(resp.data)
+        self.assertEqual(data[0], full[0])
+        self.assertEqual(len(data), 25)
+        self.assertEqual(data[1][0], u'00:00')
+        self.assertEqual(data[10][0], u'09:00')
+        self.assertEqual(data[10][1:], [
+            round(sum(row[i] for row in full[37:41]) / 4.0, 2)
+            for i in range(1, 8)
+        ])
+
+    def test_presence_stats_view(self):
+        """
+        Test presence time statistics view.
+        """
+        resp = self.client.get('/api/v1/presence_stats/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual([day for day, _ in data], list(calendar.day_abbr))
+        self.assertEqual(data[1][1], {
+            u'count': 1, u'mean': 30047, u'stddev': 0,
+            u'p10': 30047, u'median': 30047, u'p90': 30047,
+        })
+        self.assertEqual(data[0][1][u'count'], 0)
+
+    def test_presence_stats_view_all_users(self):
+        """
+        Test presence time statistics view of all users.
+        """
+        resp = self.client.get('/api/v1/presence_stats')
+        data = json.loads(resp.data)
+        self.assertEqual(data[1][1], {
+            u'count': 2, u'mean': 23305.5, u'stddev': 6741.5,
+            u'p10': 16564, u'median': 16564, u'p90': 30047,
+        })
+
+    @patch.object(views, 'log')
+    def test_presence_stats_user(self, mocked_log):
+        """
+        Test presence time statistics view with invalid user_id.
+        """
+        resp = self.client.get('/api/v1/presence_stats/1')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data), [])
+        mocked_log.debug.assert_called_with('User %s not found!', 1)
+
+    def test_start_end_stats_view(self):
+        """
+        Test start and end time statistics view.
+        """
+        resp = self.client.get('/api/v1/start_end_stats/11')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(data[3][0], u'Thu')
+        self.assertEqual(data[3][1][u'start'][u'count'], 2)
+        self.assertEqual(data[3][1][u'start'][u'p10'], 34088)
+        self.assertEqual(data[3][1][u'start'][u'p90'], 37116)
+        self.assertEqual(data[3][1][u'end'][u'median'], 57087)
+
+    def test_groups_view(self):
+        """
+        Test groups listing.
+        """
+        resp = self.client.get('/api/v1/groups')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(data, [
+            {u'name': u'all', u'size': 2},
+            {u'name': u'managers', u'size': 1},
+            {u'name': u'team_a', u'size': 2},
+            {u'name': u'team_b', u'size': 2},
+        ])
+
+    def test_group_presence_weekday_view(self):
+        """
+        Test total presence time of group.
+        """
+        resp = self.client.get('/api/v1/groups/team_a/presence_weekday')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(data[0], [u'Weekday', u'Presence (s)'])
+        self.assertEqual(data[2], [u'Tue', 30047 + 16564])
+        resp = self.client.get('/api/v1/groups/all/presence_weekday')
+        self.assertEqual(json.loads(resp.data), data)
+
+    def test_group_views_single_user(self):
+        """
+        Test group of single known user gives the same results as the user.
+        """
+        for endpoint in ['mean_time_weekday', 'presence_weekday',
+                         'presence_start_end']:
+            group = self.client.get(
+                '/api/v1/groups/team_b/{0}'.format(endpoint)
+            )
+            user = self.client.get('/api/v1/{0}/11'.format(endpoint))
+            self.assertEqual(json.loads(group.data), json.loads(user.data))
+
+    @patch.object(views, 'log')
+    def test_group_views_unknown_group(self, mocked_log):
+        """
+        Test group views with unknown group.
+        """
+        for endpoint in ['mean_time_weekday', 'presence_weekday',
+                         'presence_start_end']:
+            resp = self.client.get(
+                '/api/v1/groups/unknown/{0}'.format(endpoint)
+            )
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(json.loads(resp.data), [])
+            mocked_log.debug.assert_called_with(
+                'Group %s not found!', 'unknown'
+            )
+
+    def test_data_quality_view(self):
+        """
+        Test data quality report view.
+        """
+        resp = self.client.get('/admin/data_quality', headers=self.admin)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(data['rows'], 8)
+        self.assertEqual(data['malformed'], 2)
+        self.assertEqual(
+            data['malformed_lines'],
+            [[TEST_DATA_CSV, 9], [TEST_DATA_CSV, 10]]
+        )
+        self.assertEqual(data['duplicates'], 0)
+
+    def test_presence_calendar_page(self):
+        """
+        Test presence_calendar page.
+        """
+        resp = self.client.get('/presence_calendar')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'text/html; charset=utf-8')
+
+    def test_presence_calendar_view(self):
+        """
+        Test daily presence time view.
+        """
+        resp = self.client.get('/api/v1/presence_calendar/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        self.assertEqual(json.loads(resp.data), {
+            u'start': u'2013-09-10', u'minutes': [501, 408, 395],
+        })
+
+        resp = self.client.get(
+            '/api/v1/presence_calendar/10?from=2013-09-08&to=2013-09-11'
+        )
+        self.assertEqual(json.loads(resp.data), {
+            u'start': u'2013-09-10', u'minutes': [501, 408],
+        })
+
+        resp = self.client.get(
+            '/api/v1/presence_calendar/10?from=1000-01-01&to=9999-12-31'
+        )
+        self.assertEqual(json.loads(resp.data), {
+            u'start': u'2013-09-10', u'minutes': [501, 408, 395],
+        })
+
+        resp = self.client.get(
+            '/api/v1/presence_calendar/10?from=2013-09-11&to='
+        )
+        self.assertEqual(json.loads(resp.data), {
+            u'start': u'2013-09-11', u'minutes': [408, 395],
+        })
+
+        for query in ['from=2013-13-01', 'to=yesterday', 'from=10']:
+            resp = self.client.get(
+                '/api/v1/presence_calendar/10?' + query
+            )
+            self.assertEqual(resp.status_code, 400)
+
+        resp = self.client.get(
+            '/api/v1/presence_calendar/10?from=2013-10-01&to=2013-09-01'
+        )
+        self.assertEqual(json.loads(resp.data), [])
+
+    @patch.object(views, 'log')
+    def test_presence_calendar_user(self, mocked_log):
+        """
+        Test daily presence time view with invalid user_id.
+        """
+        for query in ['', '?from=2013-09-01', '?to=2013-09-30']:
+            resp = self.client.get('/api/v1/presence_calendar/1' + query)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(json.loads(resp.data), [])
+            mocked_log.debug.assert_called_with('User %s not found!', 1)
+
+    def test_presence_calendar_payload(self):
+        """
+        Test several years of daily presence fit in a few kilobytes.
+        """
+        workdir = tempfile.mkdtemp()
+        path = os.path.join(workdir, 'data.csv')
+        try:
+            loadtest.generate_presence_csv(path, users=1, days=3 * 365)
+            main.app.config.update({'DATA_CSV': path})
+            resp = self.client.get('/api/v1/presence_calendar/10')
+        finally:
+            shutil.rmtree(workdir)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data['minutes']), 3 * 365)
+        self.assertLess(len(resp.data), 5 * 1024)
+
+    def test_admin_forbidden(self):
+        """
+        Test admin views require configured token.
+        """
+        for url in ['/admin/data_quality', '/admin/cache']:
+            self.assertEqual(self.client.get(url).status_code, 403)
+            resp = self.client.get(url, headers={'X-Admin-Token': 'wrong'})
+            self.assertEqual(resp.status_code, 403)
+        for url in ['/admin/cache/reload', '/admin/cache/flush']:
+            self.assertEqual(self.client.post(url).status_code, 403)
+        main.app.config.update({'ADMIN_TOKEN': None})
+        resp = self.client.get('/admin/cache', headers={'X-Admin-Token': ''})
+        self.assertEqual(resp.status_code, 403)
+
+    def test_cache_view(self):
+        """
+        Test cache state view.
+        """
+        self.client.get('/')
+        self.client.get('/api/v1/presence_weekday/10')
+        resp = self.client.get('/admin/cache', headers=self.admin)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(data['data']['path'], TEST_DATA_CSV)
+        self.assertEqual(data['data']['rows'], 8)
+        self.assertEqual(data['data']['users'], 2)
+        self.assertGreater(data['data']['memory_bytes'], 0)
+        self.assertGreaterEqual(data['data']['load_duration'], 0)
+        self.assertEqual(data['data']['files'][0]['size'],
+                         os.path.getsize(TEST_DATA_CSV))
+        self.assertTrue(data['users']['loaded'])
+        self.assertEqual(data['users']['path'], TEST_DATA_USERS)
+        self.assertTrue(data['menu']['loaded'])
+
+    def test_cache_flush_view(self):
+        """
+        Test flushing caches.
+        """
+        self.client.get('/')
+        resp = self.client.post('/admin/cache/flush', headers=self.admin)
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertFalse(data['data']['files'][0]['loaded'])
+        self.assertEqual(data['data']['cached_results'], 0)
+        self.assertFalse(data['users']['loaded'])
+        self.assertFalse(data['menu']['loaded'])
+        self.test_presence_weekday_view()
+
+    def test_cache_reload_view(self):
+        """
+        Test reloading caches while requests are served.
+        """
+        expected = self.client.get('/api/v1/presence_weekday/10').data
+        results = []
+
+        def request():
+            """
+            Requests presence weekday repeatedly.
+            """
+            client = main.app.test_client()
+            for _ in range(20):
+                resp = client.get('/api/v1/presence_weekday/10')
+                results.append((resp.status_code, resp.data))
+
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(5):
+            resp = self.client.post('/admin/cache/reload', headers=self.admin)
+            self.assertEqual(resp.status_code, 200)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [(200, expected)] * 80)
+        data = json.loads(resp.data)
+        self.assertTrue(data['data']['files'][0]['loaded'])
+        self.assertTrue(data['users']['loaded'])
+        self.assertTrue(data['menu']['loaded'])
+
+    def test_presence_weekday_coalesced(self):
+        """
+        Test burst of identical requests is computed once.
+        """
+        expected = self.client.get('/api/v1/presence_weekday/10').data
+        released = threading.Event()
+        results = []
+
+        def slow_group_by_weekday(items):
+            """
+            Groups presence once all requests are in flight.
+            """
+            released.wait(5)
+            return utils.group_by_weekday(items)
+
+        def request():
+            """
+            Requests presence weekday once.
+            """
+            resp = main.app.test_client().get('/api/v1/presence_weekday/10')
+            results.append((resp.status_code, resp.data))
+
+        with patch.object(views, 'group_by_weekday',
+                          side_effect=slow_group_by_weekday) as grouping:
+            threads = [threading.Thread(target=request) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.2)
+            released.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(grouping.call_count, 1)
+        self.assertEqual(results, [(200, expected)] * 10)
+        self.assertEqual(utils.INFLIGHT, {})
+
     def test_presence_start_end_view(self):
         """
         Test presence mean start and mean end time view.
@@ -173,6 +566,111 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
         ]
         self.assertEqual(data, expected_output)
 
+    def test_mean_time_weekday_chart_view(self):
+        """
+        Test mean time weekday chart view.
+        """
+        resp = self.client.get('/api/v1/charts/mean_time_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(data['cols'], [
+            {u'type': u'string', u'label': u'Weekday'},
+            {u'type': u'datetime', u'label': u'Mean time (h:m:s)'},
+        ])
+        self.assertEqual(len(data['rows']), 7)
+        self.assertEqual(data['rows'][1], {u'c': [
+            {u'v': u'Tue'},
+            {u'v': u'Date(1970,0,1,8,20,47)', u'f': u'08:20:47'},
+        ]})
+
+    def test_presence_start_end_chart_view(self):
+        """
+        Test presence start end chart view.
+        """
+        resp = self.client.get('/api/v1/charts/presence_start_end/10')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(
+            [col['type'] for col in data['cols']],
+            [u'string', u'datetime', u'datetime']
+        )
+        self.assertEqual(data['rows'][1], {u'c': [
+            {u'v': u'Tue'},
+            {u'v': u'Date(1970,0,1,9,39,5)', u'f': u'09:39:05'},
+            {u'v': u'Date(1970,0,1,17,59,52)', u'f': u'17:59:52'},
+        ]})
+
+    @patch.object(views, 'log')
+    def test_chart_views_user(self, mocked_log):
+        """
+        Test chart views with invalid user_id.
+        """
+        for name in ['mean_time_weekday', 'presence_start_end',
+                     'presence_calendar']:
+            resp = self.client.get('/api/v1/charts/{0}/1'.format(name))
+            self.assertEqual(resp.status_code, 200)
+            data = json.loads(resp.data)
+            self.assertGreater(len(data['cols']), 1)
+            self.assertEqual(data['rows'], [])
+            mocked_log.debug.assert_called_with('User %s not found!', 1)
+
+    def test_presence_calendar_chart_view(self):
+        """
+        Test presence calendar chart view.
+        """
+        resp = self.client.get('/api/v1/charts/presence_calendar/10')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data['cols'], [
+            {u'type': u'date', u'label': u'Date'},
+            {u'type': u'number', u'label': u'Minutes'},
+        ])
+        self.assertEqual(data['p'], {u'bucket': u'day'})
+        self.assertEqual(data['rows'], [
+            {u'c': [{u'v': u'Date(2013,8,10)'}, {u'v': 501}]},
+            {u'c': [{u'v': u'Date(2013,8,11)'}, {u'v': 408}]},
+            {u'c': [{u'v': u'Date(2013,8,12)'}, {u'v': 395}]},
+        ])
+
+        resp = self.client.get(
+            '/api/v1/charts/presence_calendar/10?from=2013-09-11&resolution=1'
+        )
+        data = json.loads(resp.data)
+        self.assertEqual(data['p'], {u'bucket': u'week'})
+        self.assertEqual(data['rows'], [
+            {u'c': [{u'v': u'Date(2013,8,9)'}, {u'v': 803}]},
+        ])
+
+        resp = self.client.get(
+            '/api/v1/charts/presence_calendar/10?from=2013-09-11&to=x'
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_presence_calendar_chart_payload(self):
+        """
+        Test several years of daily presence are sent as a few buckets.
+        """
+        workdir = tempfile.mkdtemp()
+        path = os.path.join(workdir, 'data.csv')
+        try:
+            loadtest.generate_presence_csv(path, users=1, days=3 * 365)
+            main.app.config.update({'DATA_CSV': path})
+            legacy = self.client.get('/api/v1/presence_calendar/10')
+            resp = self.client.get(
+                '/api/v1/charts/presence_calendar/10?resolution=800'
+            )
+        finally:
+            shutil.rmtree(workdir)
+        data = json.loads(resp.data)
+        self.assertEqual(data['p'], {u'bucket': u'week'})
+        self.assertLessEqual(len(data['rows']), 800)
+        self.assertEqual(
+            sum(row['c'][1]['v'] for row in data['rows']),
+            sum(json.loads(legacy.data)['minutes'])
+        )
+        self.assertLess(len(resp.data), len(legacy.data) * 2)
+
 
 class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
     """
@@ -186,6 +684,7 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
         main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
         main.app.config.update({'MENU_CSV': TEST_MENU_CSV})
         main.app.config.update({'DATA_USERS': TEST_DATA_USERS})
+        main.app.config.update({'DATA_GROUPS': TEST_DATA_GROUPS})
 
     def tearDown(self):
         """
@@ -253,6 +752,325 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
                          datetime.time(9, 39, 5))
         self.assertEqual(len(data[11]), 5)
 
+    def test_get_data_cache(self):
+        """
+        Test presence data is parsed again only when the file changes.
+        """
+        workdir = tempfile.mkdtemp()
+        path = os.path.join(workdir, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, path)
+        main.app.config.update({'DATA_CSV': path})
+        try:
+            with patch.object(utils.csv, 'reader',
+                              wraps=utils.csv.reader) as reader:
+                data = utils.get_data()
+                self.assertIs(utils.get_data(), data)
+                self.assertEqual(reader.call_count, 1)
+
+                with open(path, 'a') as csvfile:
+                    csvfile.write('\n12,2013-09-10,09:00:00,17:00:00\n')
+                self.assertIn(12, utils.get_data())
+                self.assertEqual(reader.call_count, 2)
+        finally:
+            shutil.rmtree(workdir)
+
+    def test_occupancy(self):
+        """
+        Test mean number of present users per time slot.
+        """
+        slots = utils.occupancy()
+        self.assertItemsEqual(slots.keys(), range(7))
+        self.assertEqual(len(slots[1]), utils.SLOTS_PER_DAY)
+        # Tuesday: user 11 from 09:19:50, user 10 from 09:39:05
+        self.assertEqual(slots[1][36], 0)
+        self.assertEqual(slots[1][37], 1)
+        self.assertEqual(slots[1][38], 2)
+        # user 11 leaves at 13:55:54, user 10 at 17:59:52
+        self.assertEqual(slots[1][55], 2)
+        self.assertEqual(slots[1][56], 1)
+        self.assertEqual(slots[1][71], 1)
+        self.assertEqual(slots[1][72], 0)
+        # Thursday: two days, both users present only on the second one
+        self.assertEqual(slots[3][37], 0.5)
+        self.assertEqual(slots[3][43], 1.5)
+        self.assertEqual(utils.occupancy((10,))[3][43], 1)
+        self.assertEqual(utils.occupancy((1,))[3][43], 0)
+
+        entries = len(utils.CACHE['entries'])
+        for user_id in range(20):
+            utils.occupancy((10, user_id))
+        self.assertEqual(len(utils.CACHE['entries']), entries)
+
+    def test_get_groups(self):
+        """
+        Test reading groups from CSV file and users.xml.
+        """
+        self.assertEqual(utils.get_groups(), {
+            'team_a': set([10, 11]),
+            'team_b': set([11, 99]),
+            'managers': set([141]),
+        })
+        main.app.config.update({'DATA_GROUPS': None})
+        self.assertEqual(utils.get_groups(), {'managers': set([141])})
+
+    def test_get_groups_cache(self):
+        """
+        Test groups are read again only when groups or users file changes.
+        """
+        workdir = tempfile.mkdtemp()
+        groups_csv = os.path.join(workdir, 'groups.csv')
+        users_xml = os.path.join(workdir, 'users.xml')
+        shutil.copy(TEST_DATA_GROUPS, groups_csv)
+        shutil.copy(TEST_DATA_USERS, users_xml)
+        main.app.config.update({
+            'DATA_GROUPS': groups_csv, 'DATA_USERS': users_xml,
+        })
+        try:
+            groups = utils.get_groups()
+            self.assertIs(utils.get_groups(), groups)
+
+            with open(groups_csv, 'a') as csvfile:
+                csvfile.write('team_c,12\nqa/testing,12\n..,12\n')
+            self.assertEqual(utils.get_groups()['team_c'], set([12]))
+            self.assertNotIn('qa/testing', utils.get_groups())
+            self.assertNotIn('..', utils.get_groups())
+
+            with open(users_xml, 'w') as handle:
+                handle.write(
+                    '<intranet><users>'
+                    '<user id="x" groups="bad"/>'
+                    '<user groups="bad"/>'
+                    '<user id="12" groups="managers, ../x, ."/>'
+                    '</users></intranet>'
+                )
+            self.assertEqual(utils.get_groups()['managers'], set([12]))
+            self.assertNotIn('../x', utils.get_groups())
+            self.assertNotIn('.', utils.get_groups())
+            self.assertNotIn('bad', utils.get_groups())
+
+            with open(users_xml, 'w') as handle:
+                handle.write('<intranet><server/></intranet>')
+            self.assertNotIn('managers', utils.get_groups())
+        finally:
+            shutil.rmtree(workdir)
+            main.app.config.update({
+                'DATA_GROUPS': TEST_DATA_GROUPS, 'DATA_USERS': TEST_DATA_USERS,
+            })
+
+    def test_group_partials(self):
+        """
+        Test summing per-user partials.
+        """
+        users, total = utils.get_partials()
+        self.assertEqual(users[10][1], [1, 30047, 34745, 64792])
+        self.assertEqual(users[11][1], [1, 16564, 33590, 50154])
+        self.assertEqual(total[1], [2, 46611, 68335, 114946])
+        self.assertIs(utils.group_partials(), total)
+        self.assertEqual(utils.group_partials((10, 11)), total)
+        self.assertEqual(utils.group_partials((11, 99))[1], users[11][1])
+        self.assertIsNone(utils.get_group_partials('unknown'))
+        self.assertEqual(utils.get_group_partials('all'), total)
+
+    def test_get_menu_cache(self):
+        """
+        Test cached menu is not modified by selecting a page.
+        """
+        utils.get_menu('mainpage')
+        self.assertNotIn('selected', utils.get_menu_data()[0])
+        self.assertIs(utils.get_menu_data(), utils.get_menu_data())
+
+    def test_estimate_size(self):
+        """
+        Test estimating memory footprint.
+        """
+        shared = [1, 2, 3]
+        self.assertGreater(
+            utils.estimate_size({'a': shared}), utils.estimate_size(shared)
+        )
+        self.assertEqual(
+            utils.estimate_size([shared, shared]),
+            sys.getsizeof([shared, shared]) + utils.estimate_size(shared)
+        )
+
+    def test_single_flight(self):
+        """
+        Test concurrent callers share one computation.
+        """
+        released = threading.Event()
+        calls = []
+        results = []
+
+        def compute():
+            """
+            Computes new result once released.
+            """
+            calls.append(1)
+            released.wait(5)
+            return object()
+
+        def call():
+            """
+            Calls compute through single_flight.
+            """
+            results.append(utils.single_flight('key', compute))
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        released.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(set(id(result) for result in results)), 1)
+        self.assertEqual(utils.INFLIGHT, {})
+
+        # results are not cached once the computation finished
+        self.assertIsNot(utils.single_flight('key', compute), results[0])
+        self.assertEqual(len(calls), 2)
+
+    def test_single_flight_error(self):
+        """
+        Test exception of shared computation is raised to all callers.
+        """
+        released = threading.Event()
+        errors = []
+
+        def compute():
+            """
+            Fails once released.
+            """
+            released.wait(5)
+            raise ValueError('broken')
+
+        def call():
+            """
+            Calls compute through single_flight.
+            """
+            try:
+                utils.single_flight('key', compute)
+            except ValueError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        released.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(len(set(id(error) for error in errors)), 1)
+        self.assertEqual(utils.INFLIGHT, {})
+
+    def test_single_flight_timeout(self):
+        """
+        Test waiting for shared computation times out.
+        """
+        released = threading.Event()
+        leader = threading.Thread(
+            target=utils.single_flight, args=('key', lambda: released.wait(5))
+        )
+        leader.start()
+        time.sleep(0.1)
+        try:
+            with self.assertRaises(HTTPException) as raised:
+                utils.single_flight('key', lambda: None, timeout=0.05)
+            self.assertEqual(raised.exception.code, 503)
+            self.assertEqual(utils.single_flight('other', lambda: 1), 1)
+        finally:
+            released.set()
+            leader.join()
+
+    def test_time_cell(self):
+        """
+        Test building DataTable time of day cell.
+        """
+        self.assertEqual(utils.time_cell(0), {
+            'v': 'Date(1970,0,1,0,0,0)', 'f': '00:00:00',
+        })
+        self.assertEqual(utils.time_cell(34745.6), {
+            'v': 'Date(1970,0,1,9,39,6)', 'f': '09:39:06',
+        })
+        self.assertEqual(utils.time_cell(-3600), {
+            'v': 'Date(1970,0,1,0,0,0)', 'f': '00:00:00',
+        })
+        self.assertEqual(utils.time_cell(90000), {
+            'v': 'Date(1970,0,1,23,59,59)', 'f': '23:59:59',
+        })
+
+    def test_date_value(self):
+        """
+        Test formatting DataTable date value.
+        """
+        self.assertEqual(
+            utils.date_value(datetime.date(2013, 1, 31)), 'Date(2013,0,31)'
+        )
+
+    def test_downsample(self):
+        """
+        Test averaging consecutive rows.
+        """
+        rows = [['a', 1, 10], ['b', 3, 20], ['c', 5, 30]]
+        self.assertIs(utils.downsample(rows), rows)
+        self.assertIs(utils.downsample(rows, 3), rows)
+        self.assertEqual(
+            utils.downsample(rows, 2), [['a', 2.0, 15.0], ['c', 5.0, 30.0]]
+        )
+        self.assertEqual(utils.downsample(rows, 1), [['a', 3.0, 20.0]])
+
+    def test_calendar_buckets(self):
+        """
+        Test summing daily values by day, week and month.
+        """
+        start = datetime.date(2013, 9, 27)
+        values = [10, 0, 0, 20, 30, 0, 0, 0, 0, 0, 0, 40]
+        self.assertEqual(utils.calendar_buckets(start, values), ('day', [
+            (datetime.date(2013, 9, 27), 10),
+            (datetime.date(2013, 9, 30), 20),
+            (datetime.date(2013, 10, 1), 30),
+            (datetime.date(2013, 10, 8), 40),
+        ]))
+        self.assertEqual(utils.calendar_buckets(start, values, 3), (
+            'week', [
+                (datetime.date(2013, 9, 23), 10),
+                (datetime.date(2013, 9, 30), 50),
+                (datetime.date(2013, 10, 7), 40),
+            ]
+        ))
+        self.assertEqual(utils.calendar_buckets(start, values, 2), (
+            'month', [
+                (datetime.date(2013, 9, 1), 30),
+                (datetime.date(2013, 10, 1), 70),
+            ]
+        ))
+        self.assertEqual(utils.calendar_buckets(start, []), ('day', []))
+
+    def test_datatable(self):
+        """
+        Test building DataTable JSON.
+        """
+        self.assertEqual(
+            utils.datatable(
+                [('string', 'Weekday'), ('number', 'Presence (s)')],
+                [('Mon', 10), ('Tue', {'v': 20, 'f': '20 s'})],
+            ),
+            {
+                'cols': [
+                    {'type': 'string', 'label': 'Weekday'},
+                    {'type': 'number', 'label': 'Presence (s)'},
+                ],
+                'rows': [
+                    {'c': [{'v': 'Mon'}, {'v': 10}]},
+                    {'c': [{'v': 'Tue'}, {'v': 20, 'f': '20 s'}]},
+                ],
+            }
+        )
+        self.assertEqual(utils.datatable([], []), {'cols': [], 'rows': []})
+
     def test_interval(self):
         """
         Test interval method.
@@ -325,6 +1143,1217 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
         self.assertEqual(weekdays, expected_output)
 
 
+class PresenceAnalyzerShardsTestCase(unittest.TestCase):
+    """
+    Sharded presence data tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.workdir = tempfile.mkdtemp()
+        self.write_shard('2013-08.csv', [
+            '10,2013-08-30,09:00:00,17:00:00',
+            '11,2013-08-30,08:00:00,16:00:00',
+        ])
+        self.write_shard('2013-09.csv', [
+            'user_id,date,start,end',
+            '10,2013-09-02,09:00:00,17:00:00',
+            '10,2013-08-30,10:00:00,18:00:00',
+        ])
+        main.app.config.update({'DATA_CSV': self.workdir})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        shutil.rmtree(self.workdir)
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+    def write_shard(self, name, lines):
+        """
+        Writes shard file with given lines.
+        """
+        with open(os.path.join(self.workdir, name), 'w') as csvfile:
+            csvfile.write('\n'.join(lines) + '\n')
+
+    def test_shard_period(self):
+        """
+        Test reading shard period from file name.
+        """
+        self.assertEqual(
+            utils.shard_period('/data/presence-2013-02.csv'),
+            (datetime.date(2013, 2, 1), datetime.date(2013, 2, 28))
+        )
+        self.assertEqual(
+            utils.shard_period('2013-09-10.csv'),
+            (datetime.date(2013, 9, 10), datetime.date(2013, 9, 10))
+        )
+        self.assertIsNone(utils.shard_period('sample_data.csv'))
+        self.assertIsNone(utils.shard_period('2013-13.csv'))
+
+    def test_get_data_shards(self):
+        """
+        Test merging shards with later shards winning.
+        """
+        data = utils.get_data()
+        self.assertItemsEqual(data.keys(), [10, 11])
+        self.assertEqual(len(data[10]), 2)
+        self.assertEqual(
+            data[10][datetime.date(2013, 8, 30)]['start'],
+            datetime.time(10, 0, 0)
+        )
+
+    def test_get_data_glob(self):
+        """
+        Test selecting shards with glob pattern.
+        """
+        main.app.config.update({
+            'DATA_CSV': os.path.join(self.workdir, '*-08.csv')
+        })
+        data = utils.get_data()
+        self.assertEqual(
+            data[10][datetime.date(2013, 8, 30)]['start'],
+            datetime.time(9, 0, 0)
+        )
+
+    def test_get_data_range(self):
+        """
+        Test loading only shards overlapping date range.
+        """
+        with patch.object(utils, 'parse_presence_csv',
+                          wraps=utils.parse_presence_csv) as parse:
+            data = utils.get_data(
+                datetime.date(2013, 9, 1), datetime.date(2013, 9, 30)
+            )
+            self.assertEqual(
+                data, {10: {datetime.date(2013, 9, 2): {
+                    'start': datetime.time(9, 0, 0),
+                    'end': datetime.time(17, 0, 0),
+                }}}
+            )
+            self.assertEqual(parse.call_count, 1)
+
+    def test_presence_calendar_range(self):
+        """
+        Test calendar of a date range loads only shards overlapping it.
+        """
+        client = main.app.test_client()
+        with patch.object(utils, 'parse_presence_csv',
+                          wraps=utils.parse_presence_csv) as parse:
+            resp = client.get(
+                '/api/v1/presence_calendar/10?from=2013-09-01&to=2013-09-30'
+            )
+            self.assertEqual(parse.call_count, 1)
+        self.assertEqual(json.loads(resp.data), {
+            u'start': u'2013-09-02', u'minutes': [480],
+        })
+
+        resp = client.get(
+            '/api/v1/presence_calendar/11?from=2013-09-01&to=2013-09-30'
+        )
+        self.assertEqual(json.loads(resp.data), [])
+
+    def test_presence_calendar_index(self):
+        """
+        Test calendar of a date range is sliced from the cached index.
+        """
+        utils.get_calendar_index()
+        with patch.object(utils, 'merge_shards') as merge_shards:
+            self.assertEqual(
+                utils.presence_calendar(
+                    10, datetime.date(2013, 9, 1), datetime.date(2013, 9, 30)
+                ),
+                (datetime.date(2013, 9, 2), [480])
+            )
+            self.assertIsNone(utils.presence_calendar(
+                11, datetime.date(2013, 9, 1), datetime.date(2013, 9, 30)
+            ))
+            self.assertFalse(merge_shards.called)
+
+        ranges = [
+            (None, datetime.date(2013, 8, 31)),
+            (datetime.date(2013, 8, 31), None),
+            (datetime.date(2013, 8, 1), datetime.date(2013, 9, 30)),
+            (datetime.date(2013, 9, 3), datetime.date(2013, 9, 30)),
+        ]
+        for user_id in [10, 11, 12]:
+            for date_from, date_to in ranges:
+                sliced = utils.presence_calendar(user_id, date_from, date_to)
+                utils.flush_caches()
+                self.assertEqual(
+                    utils.presence_calendar(user_id, date_from, date_to),
+                    sliced, (user_id, date_from, date_to)
+                )
+                utils.get_calendar_index()
+
+    def test_evict_removed_shards(self):
+        """
+        Test removed shards are dropped from memory.
+        """
+        removed = os.path.join(self.workdir, '2013-08.csv')
+        utils.get_data()
+        self.assertIn(removed, utils.SHARDS)
+
+        os.unlink(removed)
+        data = utils.get_data()
+        self.assertNotIn(removed, utils.SHARDS)
+        self.assertItemsEqual(data.keys(), [10])
+
+    def test_quality_report(self):
+        """
+        Test quality report collected while parsing shards.
+        """
+        self.write_shard('2013-10.csv', [
+            '10,2013-10-01,09:00:00,09:00:00',
+            '10,2013-10-02,17:00:00,09:00:00',
+            '10,2013-10-03,22:00:00,06:00:00',
+            '10,2013-10-04,09:00:00,1700',
+            '10,2999-10-04,09:00:00,17:00:00',
+            '10,2013-10-01,09:00:00,17:00:00',
+        ])
+        with patch.object(utils, 'parse_presence_csv',
+                          wraps=utils.parse_presence_csv) as parse:
+            utils.get_data()
+            report = utils.get_quality_report()
+            self.assertEqual(parse.call_count, 3)
+
+        shard = os.path.join(self.workdir, '2013-10.csv')
+        self.assertEqual(report['lines'], 11)
+        self.assertEqual(report['rows'], 9)
+        self.assertEqual(report['headers'], 1)
+        self.assertEqual(report['malformed'], 1)
+        self.assertEqual(report['malformed_lines'], [[shard, 4]])
+        self.assertEqual(report['zero'], 1)
+        self.assertEqual(report['negative'], 1)
+        self.assertEqual(report['overnight'], 1)
+        self.assertEqual(report['future'], 1)
+        self.assertEqual(report['duplicates'], 2)
+        self.assertItemsEqual(report['duplicate_rows'], [{
+            'user_id': 10,
+            'date': '2013-10-01',
+            'kept': [shard, 6],
+            'dropped': [shard, 1],
+        }, {
+            'user_id': 10,
+            'date': '2013-08-30',
+            'kept': [os.path.join(self.workdir, '2013-09.csv'), None],
+            'dropped': [os.path.join(self.workdir, '2013-08.csv'), None],
+        }])
+        self.assertEqual(report['files'][shard]['rows'], 5)
+        self.assertEqual(report['files'][shard]['future'], 1)
+        self.assertEqual(report['last_date'], '2999-10-04')
+
+        # future rows are counted against the current day
+        later = datetime.date(3000, 1, 1)
+        with patch.object(utils, 'date_type') as date_type:
+            date_type.today.return_value = later
+            self.assertEqual(utils.get_quality_report()['future'], 0)
+
+    def test_cache_state(self):
+        """
+        Test cache state of shards counts rows and memoizes memory
+        estimates.
+        """
+        shard = os.path.join(self.workdir, '2013-10.csv')
+        self.write_shard('2013-10.csv', [
+            '10,2013-10-01,09:00:00,17:00:00',
+            '10,2013-10-01,09:30:00,17:00:00',
+            '11,2013-10-01,09:00:00,17:00:00',
+        ])
+        with patch.object(utils, 'estimate_size',
+                          wraps=utils.estimate_size) as estimate:
+            utils.get_data()
+            self.assertFalse(estimate.called)
+            state = utils.cache_state()
+            self.assertTrue(estimate.called)
+            estimate.reset_mock()
+            self.assertEqual(utils.cache_state(), state)
+            self.assertFalse(estimate.called)
+
+        files = {item['path']: item for item in state['data']['files']}
+        self.assertEqual(files[shard]['rows'], 3)
+        self.assertEqual(files[shard]['users'], 2)
+        self.assertEqual(
+            files[shard]['memory_bytes'],
+            utils.estimate_size(utils.parse_presence_csv(shard))
+        )
+        self.assertEqual(state['data']['rows'], 7)
+
+        self.write_shard('2013-10.csv', [
+            '11,2013-10-02,09:00:00,17:00:00',
+        ])
+        utils.get_data()
+        with patch.object(utils, 'estimate_size',
+                          wraps=utils.estimate_size) as estimate:
+            state = utils.cache_state()
+            # recursive calls pass seen objects, top level ones do not
+            self.assertEqual(
+                len([args for args, _ in estimate.call_args_list
+                     if len(args) == 1]),
+                1
+            )
+        files = {item['path']: item for item in state['data']['files']}
+        self.assertEqual(
+            files[shard]['memory_bytes'],
+            utils.estimate_size(utils.parse_presence_csv(shard))
+        )
+        self.assertEqual(len(utils.SHARD_SIZES), 3)
+
+    def test_get_data_new_shard(self):
+        """
+        Test only new shard is parsed when it arrives.
+        """
+        utils.get_data()
+        with patch.object(utils, 'parse_presence_csv',
+                          wraps=utils.parse_presence_csv) as parse:
+            self.write_shard('2013-10.csv', [
+                '12,2013-10-01,09:00:00,17:00:00',
+            ])
+            data = utils.get_data()
+            parse.assert_called_once_with(
+                os.path.join(self.workdir, '2013-10.csv')
+            )
+        self.assertItemsEqual(data.keys(), [10, 11, 12])
+
+
+class PresenceAnalyzerCompressionTestCase(unittest.TestCase):
+    """
+    Compressed presence data tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        shutil.rmtree(self.workdir)
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+    def test_compressed_data(self):
+        """
+        Test compressed files give the same data as the plain one.
+        """
+        expected = utils.parse_presence_csv(TEST_DATA_CSV)[0]
+        copies = benchmarks.compress(TEST_DATA_CSV, self.workdir)
+        self.assertIn(('gzip', os.path.join(
+            self.workdir, 'test_data.csv.gz'
+        )), copies)
+        for _, path in copies:
+            self.assertEqual(utils.parse_presence_csv(path)[0], expected)
+
+        main.app.config.update({
+            'DATA_CSV': os.path.join(self.workdir, '*.bz2')
+        })
+        self.assertEqual(utils.get_data(), expected)
+
+    @patch.object(utils, 'get_lzma', return_value=None)
+    def test_xz_without_lzma(self, _):
+        """
+        Test reading xz file without lzma module.
+        """
+        with self.assertRaises(IOError):
+            utils.open_data_file(os.path.join(self.workdir, 'data.csv.xz'))
+
+    def test_benchmark_compression(self):
+        """
+        Test compression benchmark report.
+        """
+        stream = StringIO()
+        with patch.object(benchmarks, 'drop_page_cache', return_value=False):
+            results = benchmarks.benchmark_compression(
+                TEST_DATA_CSV, repeat=1, stream=stream
+            )
+        self.assertEqual(results[0][0], 'plain')
+        self.assertIn('gzip', [name for name, _, _, _ in results])
+        for _, size, cold, warm in results:
+            self.assertGreater(size, 0)
+            self.assertIsNone(cold)
+            self.assertGreaterEqual(warm, 0)
+        self.assertEqual(len(stream.getvalue().splitlines()), len(results) + 1)
+
+
+class PresenceAnalyzerExportTestCase(unittest.TestCase):
+    """
+    Static export tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.workdir = tempfile.mkdtemp()
+        self.data_csv = os.path.join(self.workdir, 'data.csv')
+        self.export_dir = os.path.join(self.workdir, 'export')
+        shutil.copy(TEST_DATA_CSV, self.data_csv)
+        main.app.config.update({
+            'DATA_CSV': self.data_csv,
+            'MENU_CSV': TEST_MENU_CSV,
+            'DATA_USERS': TEST_DATA_USERS,
+            'DATA_GROUPS': TEST_DATA_GROUPS,
+        })
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        shutil.rmtree(self.workdir)
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+    def test_export_path(self):
+        """
+        Test mapping URLs to exported files.
+        """
+        self.assertEqual(
+            export.export_path('/srv', '/'), '/srv/index.html'
+        )
+        self.assertEqual(
+            export.export_path('/srv', '/occupancy'),
+            '/srv/occupancy/index.html'
+        )
+        self.assertEqual(
+            export.export_path('/srv', '/api/v1/presence_weekday/10'),
+            '/srv/api/v1/presence_weekday/10.json'
+        )
+
+    def test_export(self):
+        """
+        Test full and incremental export.
+        """
+        unrelated = [
+            os.path.join(self.export_dir, 'unrelated.html'),
+            os.path.join(self.export_dir, 'api', 'v1', 'other.json'),
+        ]
+        for path in unrelated:
+            export.write_if_changed(path, 'keep')
+
+        result = export.export(main.app, self.export_dir, workers=4)
+        urls = export.export_urls()
+        self.assertIn('/api/v1/presence_start_end/11', urls)
+        self.assertIn('/api/v1/groups/team_a/presence_weekday', urls)
+        self.assertEqual(result['written'], len(urls))
+        self.assertEqual(result['removed'], 0)
+
+        client = main.app.test_client()
+        with open(export.export_path(
+                self.export_dir, '/api/v1/presence_weekday/10')) as handle:
+            self.assertEqual(
+                handle.read(),
+                client.get('/api/v1/presence_weekday/10').data
+            )
+
+        result = export.export(main.app, self.export_dir, workers=4)
+        self.assertEqual(result['written'], 0)
+        self.assertEqual(result['unchanged'], len(urls))
+
+        with open(self.data_csv, 'w') as csvfile:
+            csvfile.write('10,2013-09-10,09:39:05,17:59:52\n')
+        result = export.export(main.app, self.export_dir, workers=4)
+        self.assertGreater(result['written'], 0)
+        self.assertEqual(result['removed'], len(export.USER_API))
+        self.assertFalse(os.path.exists(export.export_path(
+            self.export_dir, '/api/v1/presence_weekday/11'
+        )))
+        for path in unrelated:
+            self.assertTrue(os.path.exists(path))
+
+
+class PresenceAnalyzerImportTestCase(unittest.TestCase):
+    """
+    Import time tests.
+    """
+
+    def test_import_time(self):
+        """
+        Test importing application modules costs little more than Flask.
+        """
+        def best(module):
+            """
+            Returns best import time of module.
+            """
+            return min(
+                benchmarks.measure_imports(module)['total']
+                for _ in range(3)
+            )
+
+        baseline = best(benchmarks.IMPORT_BASELINE)
+        for module in benchmarks.IMPORT_MODULES:
+            self.assertLess(
+                best(module), baseline * benchmarks.IMPORT_BASELINE_FACTOR,
+                module
+            )
+
+    def test_deferred_imports(self):
+        """
+        Test modules used only by commands are not imported up front.
+        """
+        for module in benchmarks.IMPORT_MODULES:
+            result = benchmarks.measure_imports(module)
+            self.assertIn(module, result['modules'])
+            self.assertEqual(
+                benchmarks.deferred_loaded(result['modules']), [], module
+            )
+
+    def test_benchmark_imports(self):
+        """
+        Test import time report.
+        """
+        stream = StringIO()
+        results = benchmarks.benchmark_imports(
+            ['presence_analyzer'], limit=3, stream=stream
+        )
+        self.assertGreater(results['presence_analyzer']['total'], 0)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('presence_analyzer: '))
+
+
+def reference_data(path):
+    """
+    Reference presence data loader, the original single file get_data().
+    """
+    data = {}
+    with open(path, 'r') as csvfile:
+        presence_reader = csv.reader(csvfile, delimiter=',')
+        for row in presence_reader:
+            if len(row) != 4:
+                continue
+            try:
+                user_id = int(row[0])
+                date = datetime.datetime.strptime(row[1], '%Y-%m-%d').date()
+                start = datetime.datetime.strptime(row[2], '%H:%M:%S').time()
+                end = datetime.datetime.strptime(row[3], '%H:%M:%S').time()
+                data.setdefault(user_id, {})[date] = {
+                    'start': start,
+                    'end': end
+                }
+            except (ValueError, TypeError):
+                pass
+    return data
+
+
+def reference_seconds(value):
+    """
+    Reference amount of seconds since midnight.
+    """
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def reference_weekdays(items):
+    """
+    Reference grouping of presence duration, start and end by weekday.
+    """
+    result = {i: {'duration': [], 'start': [], 'end': []} for i in range(7)}
+    for date, presence in items.items():
+        start = reference_seconds(presence['start'])
+        end = reference_seconds(presence['end'])
+        weekday = result[date.weekday()]
+        weekday['duration'].append(end - start)
+        weekday['start'].append(start)
+        weekday['end'].append(end)
+    return result
+
+
+def reference_mean(values):
+    """
+    Reference arithmetic mean, zero for no values.
+    """
+    return float(sum(values)) / len(values) if values else 0
+
+
+def reference_occupancy(data):
+    """
+    Reference occupancy, counting every slot covered by every presence.
+    """
+    dates = {i: set() for i in range(7)}
+    counts = {i: [0] * utils.SLOTS_PER_DAY for i in range(7)}
+    for items in data.values():
+        for date, presence in items.items():
+            start = reference_seconds(presence['start'])
+            end = reference_seconds(presence['end'])
+            if end <= start:
+                continue
+            dates[date.weekday()].add(date)
+            first = start // utils.SLOT_SECONDS
+            last = (end - 1) // utils.SLOT_SECONDS
+            for slot in range(first, last + 1):
+                counts[date.weekday()][slot] += 1
+    return {
+        weekday: [float(count) / (len(dates[weekday]) or 1)
+                  for count in slots]
+        for weekday, slots in counts.items()
+    }
+
+
+def reference_api(data, user_id):
+    """
+    Reference JSON of user API endpoints, by URL.
+    """
+    items = data[user_id]
+    weekdays = reference_weekdays(items)
+    days = calendar.day_abbr
+    first = min(items)
+    minutes = [0] * ((max(items) - first).days + 1)
+    for date, presence in items.items():
+        minutes[(date - first).days] = int(round((
+            reference_seconds(presence['end']) -
+            reference_seconds(presence['start'])
+        ) / 60.0))
+    result = {
+        '/api/v1/mean_time_weekday/{0}': [
+            [days[i], reference_mean(weekdays[i]['duration'])]
+            for i in range(7)
+        ],
+        '/api/v1/presence_weekday/{0}': [['Weekday', 'Presence (s)']] + [
+            [days[i], sum(weekdays[i]['duration'])] for i in range(7)
+        ],
+        '/api/v1/presence_start_end/{0}': [
+            [days[i], int(reference_mean(weekdays[i]['start'])),
+             int(reference_mean(weekdays[i]['end']))]
+            for i in range(7)
+        ],
+        '/api/v1/presence_calendar/{0}': {
+            'start': first.isoformat(), 'minutes': minutes,
+        },
+    }
+    return {
+        url.format(user_id): json.loads(json.dumps(value))
+        for url, value in result.items()
+    }
+
+
+def random_time(rand):
+    """
+    Draws time string, favouring edge values.
+    """
+    if rand.random() < 0.1:
+        return rand.choice(['00:00:00', '23:59:59', '12:00:00'])
+    seconds = rand.randint(0, 24 * 3600 - 1)
+    return '{0:02d}:{1:02d}:{2:02d}'.format(
+        seconds // 3600, seconds % 3600 // 60, seconds % 60
+    )
+
+
+def random_presence_lines(rand, users=5, days=60):
+    """
+    Draws presence CSV lines with duplicates, edge and malformed rows.
+    """
+    first_day = datetime.date(2013, 1, 1)
+    lines = []
+    for _ in range(rand.randint(0, users * days)):
+        user_id = rand.randint(1, users)
+        date = first_day + datetime.timedelta(days=rand.randint(0, days))
+        row = [str(user_id), date.isoformat(),
+               random_time(rand), random_time(rand)]
+        kind = rand.random()
+        if kind < 0.03:
+            row = ['user_id', 'date', 'start', 'end']
+        elif kind < 0.06:
+            row = row[:rand.randint(0, 3)]
+        elif kind < 0.09:
+            row.append('00')
+        elif kind < 0.12:
+            row[rand.randint(0, 3)] = rand.choice(
+                ['', 'x', '2013-02-30', '24:00:00', '9:0', '-1']
+            )
+        lines.append(','.join(row))
+        if rand.random() < 0.1 and lines:
+            # duplicate user and date of an earlier line
+            lines.append(rand.choice(lines))
+    return lines
+
+
+def best_time(function, repeat=5, duration=0.05):
+    """
+    Returns best time of calling function.
+
+    Each of repeated measurements calls function until given duration
+    passes, so timer resolution and noise of single short calls do not
+    decide the result.
+    """
+    best = None
+    for _ in range(repeat):
+        calls = 0
+        started = time.time()
+        while True:
+            function()
+            calls += 1
+            elapsed = time.time() - started
+            if elapsed >= duration:
+                break
+        elapsed /= calls
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class PresenceAnalyzerEquivalenceTestCase(unittest.TestCase):
+    """
+    Randomized equivalence of fast paths with reference implementations.
+    """
+
+    iterations = 20
+
+    # alternative engine may be at most this many times slower
+    performance_tolerance = 1.5
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, 'data.csv')
+        self.groups = os.path.join(self.workdir, 'groups.csv')
+        main.app.config.update({
+            'DATA_CSV': self.path,
+            'DATA_GROUPS': self.groups,
+        })
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        shutil.rmtree(self.workdir)
+        main.app.config.update({
+            'DATA_CSV': TEST_DATA_CSV,
+            'DATA_GROUPS': TEST_DATA_GROUPS,
+        })
+
+    def samples(self):
+        """
+        Writes random data files and yields lines of each one.
+        """
+        for seed in range(self.iterations):
+            rand = random.Random(seed)
+            lines = random_presence_lines(rand)
+            with open(self.path, 'w') as csvfile:
+                csvfile.write('\n'.join(lines))
+            with open(self.groups, 'w') as csvfile:
+                csvfile.write('\n'.join(
+                    'user_{0},{0}'.format(user_id) for user_id in range(7)
+                ))
+            yield seed, lines
+
+    def test_loaders(self):
+        """
+        Test single file, sharded and compressed loaders match reference.
+        """
+        for seed, lines in self.samples():
+            expected = reference_data(self.path)
+            self.assertEqual(utils.get_data(), expected, seed)
+
+            shards = os.path.join(self.workdir, 'shards')
+            os.mkdir(shards)
+            for i in range(0, len(lines), 50):
+                name = os.path.join(shards, '{0:04d}.csv'.format(i))
+                with open(name, 'w') as csvfile:
+                    csvfile.write('\n'.join(lines[i:i + 50]))
+            compressed = os.path.join(self.workdir, 'data.csv.gz')
+            handle = gzip.open(compressed, 'wb')
+            handle.write('\n'.join(lines))
+            handle.close()
+
+            for path in [shards, compressed]:
+                main.app.config.update({'DATA_CSV': path})
+                self.assertEqual(utils.get_data(), expected, seed)
+            main.app.config.update({'DATA_CSV': self.path})
+            shutil.rmtree(shards)
+
+    def test_aggregations(self):
+        """
+        Test fast aggregations match reference group_by_weekday functions.
+        """
+        for seed, _ in self.samples():
+            data = reference_data(self.path)
+            users, total = utils.get_partials()
+            self.assertEqual(sorted(users), sorted(data), seed)
+            self.assertEqual(utils.occupancy(), reference_occupancy(data))
+            for user_id, items in data.items():
+                durations = utils.group_by_weekday(items)
+                start_end = utils.group_by_weekday_start_end(items)
+                distributions = utils.weekday_distributions(user_id)
+                for weekday in range(7):
+                    self.assertEqual(users[user_id][weekday], [
+                        len(durations[weekday]),
+                        sum(durations[weekday]),
+                        sum(start_end[weekday]['start']),
+                        sum(start_end[weekday]['end']),
+                    ], seed)
+                    for name, values in \
+                            reference_weekdays(items)[weekday].items():
+                        self.assert_summary(
+                            distributions[weekday][name].summary(), values,
+                            seed
+                        )
+
+                start, minutes = utils.presence_calendar(user_id)
+                for date, presence in items.items():
+                    self.assertEqual(
+                        minutes[(date - start).days],
+                        int(round(utils.interval(
+                            presence['start'], presence['end']
+                        ) / 60.0)),
+                        seed
+                    )
+
+            total = utils.weekday_distributions()
+            for weekday in range(7):
+                values = {'duration': [], 'start': [], 'end': []}
+                for items in data.values():
+                    for name, user_values in \
+                            reference_weekdays(items)[weekday].items():
+                        values[name].extend(user_values)
+                for name in values:
+                    self.assert_summary(
+                        total[weekday][name].summary(), values[name], seed
+                    )
+
+    def assert_summary(self, summary, values, seed):
+        """
+        Asserts distribution summary matches statistics of sorted values.
+        """
+        self.assertEqual(summary['count'], len(values), seed)
+        if not values:
+            return
+        mean = reference_mean(values)
+        self.assertAlmostEqual(summary['mean'], mean, msg=seed)
+        self.assertAlmostEqual(
+            summary['stddev'],
+            math.sqrt(reference_mean([(v - mean) ** 2 for v in values])),
+            msg=seed
+        )
+        ordered = sorted(values)
+        for name, fraction in [('p10', 0.1), ('median', 0.5),
+                               ('p90', 0.9)]:
+            rank = max(int(math.ceil(fraction * len(ordered))), 1)
+            # sketch answers with mean of the bin holding the exact value
+            self.assertLess(
+                abs(summary[name] - ordered[rank - 1]), 60, (seed, name)
+            )
+
+    def test_user_api(self):
+        """
+        Test user endpoints match reference implementation.
+        """
+        for seed, _ in self.samples():
+            data = reference_data(self.path)
+            for user_id in data:
+                if user_id < 0:
+                    # not addressable by int URL converter
+                    continue
+                for url, expected in reference_api(data, user_id).items():
+                    resp = self.client.get(url)
+                    self.assertEqual(json.loads(resp.data), expected,
+                                     (seed, url))
+
+            occupancy = reference_occupancy(data)
+            resp = self.client.get('/api/v1/occupancy')
+            self.assertEqual(
+                [row[1:] for row in json.loads(resp.data)[1:]],
+                [[round(occupancy[weekday][slot], 2) for weekday in range(7)]
+                 for slot in range(utils.SLOTS_PER_DAY)],
+                seed
+            )
+
+    def test_api(self):
+        """
+        Test group endpoints of single user match user endpoints.
+        """
+        for seed, _ in self.samples():
+            for user_id in range(7):
+                for endpoint in ['mean_time_weekday', 'presence_weekday',
+                                 'presence_start_end']:
+                    user = self.client.get(
+                        '/api/v1/{0}/{1}'.format(endpoint, user_id)
+                    )
+                    group = self.client.get(
+                        '/api/v1/groups/user_{0}/{1}'.format(
+                            user_id, endpoint
+                        )
+                    )
+                    if json.loads(user.data) == []:
+                        continue
+                    self.assertEqual(
+                        json.loads(group.data), json.loads(user.data), seed
+                    )
+
+    def assert_not_slower(self, reference, alternative):
+        """
+        Asserts alternative engine is not slower than reference.
+        """
+        reference_time = best_time(reference)
+        alternative_time = best_time(alternative)
+        self.assertLessEqual(
+            alternative_time,
+            reference_time * self.performance_tolerance,
+            '{0:.4f} s vs reference {1:.4f} s'.format(
+                alternative_time, reference_time
+            )
+        )
+
+    def test_performance(self):
+        """
+        Test fast paths are not slower than reference implementations.
+        """
+        loadtest.generate_presence_csv(self.path, users=40, days=250)
+        data = utils.get_data()
+
+        self.assert_not_slower(
+            lambda: reference_data(self.path),
+            lambda: utils.parse_presence_csv(self.path),
+        )
+
+        def reference_organization():
+            """
+            Sums presence time, start and end of all users by weekday
+            from rows.
+            """
+            result = {i: [0, 0, 0] for i in range(7)}
+            for items in data.values():
+                for weekday, intervals in \
+                        utils.group_by_weekday(items).items():
+                    result[weekday][0] += sum(intervals)
+                for weekday, times in \
+                        utils.group_by_weekday_start_end(items).items():
+                    result[weekday][1] += sum(times['start'])
+                    result[weekday][2] += sum(times['end'])
+            return result
+
+        self.assert_not_slower(
+            reference_organization, utils.get_partials.uncached
+        )
+        self.assert_not_slower(
+            lambda: reference_occupancy(data),
+            lambda: utils.calculate_occupancy(data.keys()),
+        )
+
+
+class PresenceAnalyzerAdminCommandsTestCase(unittest.TestCase):
+    """
+    flask-ctl cache commands tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        main.app.config.update({
+            'DATA_CSV': TEST_DATA_CSV,
+            'ADMIN_TOKEN': 'secret',
+        })
+        self.server = loadtest.AppServer(main.app).start()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        self.server.stop()
+
+    @patch.object(script, 'make_app', return_value=main.app)
+    def test_admin_request(self, _):
+        """
+        Test cache commands call admin endpoints of running application.
+        """
+        stdout = StringIO()
+        with patch('sys.stdout', stdout):
+            script._admin_request(  # pylint: disable=W0212
+                'post', self.server.url, '/admin/cache/reload'
+            )
+        self.assertEqual(json.loads(stdout.getvalue())['data']['rows'], 8)
+
+        main.app.config.update({'ADMIN_TOKEN': None})
+        with patch('sys.stdout', StringIO()):
+            with self.assertRaises(SystemExit):
+                script._admin_request(  # pylint: disable=W0212
+                    'get', self.server.url, '/admin/cache'
+                )
+
+
+class PresenceAnalyzerStatsTestCase(unittest.TestCase):
+    """
+    Streaming statistics tests.
+    """
+
+    values = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5, 8, 9, 7, 9]
+
+    def test_running_stats(self):
+        """
+        Test running mean and standard deviation.
+        """
+        running = stats.RunningStats()
+        self.assertEqual(running.stddev, 0)
+        for value in self.values:
+            running.add(value)
+        mean = float(sum(self.values)) / len(self.values)
+        variance = sum((value - mean) ** 2 for value in self.values)
+        self.assertEqual(running.count, len(self.values))
+        self.assertAlmostEqual(running.mean, mean)
+        self.assertAlmostEqual(running.variance, variance / len(self.values))
+
+    def test_running_stats_merge(self):
+        """
+        Test merged stats equal stats of all values.
+        """
+        left, right, combined = (stats.RunningStats() for _ in range(3))
+        for value in self.values[:4]:
+            left.add(value)
+        for value in self.values[4:]:
+            right.add(value)
+        for value in self.values:
+            combined.add(value)
+        left.merge(right).merge(stats.RunningStats())
+        self.assertEqual(left.count, combined.count)
+        self.assertAlmostEqual(left.mean, combined.mean)
+        self.assertAlmostEqual(left.variance, combined.variance)
+
+    def test_quantile_sketch(self):
+        """
+        Test quantiles of exact and merged sketches.
+        """
+        sketch = stats.QuantileSketch(resolution=1)
+        self.assertEqual(sketch.quantile(0.5), 0)
+        for value in self.values[:7]:
+            sketch.add(value)
+        other = stats.QuantileSketch(resolution=1)
+        for value in self.values[7:]:
+            other.add(value)
+        sketch.merge(other)
+        ordered = sorted(self.values)
+        self.assertEqual(sketch.count, len(self.values))
+        self.assertEqual(sketch.quantile(0.1), ordered[1])
+        self.assertEqual(sketch.quantile(0.5), ordered[7])
+        self.assertEqual(sketch.quantile(0.9), ordered[13])
+        self.assertEqual(sketch.quantile(1), ordered[-1])
+
+    def test_quantile_sketch_resolution(self):
+        """
+        Test quantiles are within resolution and sketches must match.
+        """
+        sketch = stats.QuantileSketch(resolution=60)
+        for value in [100, 110, 400, 1000]:
+            sketch.add(value)
+        self.assertEqual(sketch.quantile(0.5), 105)
+        self.assertEqual(sketch.quantile(0.9), 1000)
+        with self.assertRaises(ValueError):
+            sketch.merge(stats.QuantileSketch(resolution=1))
+
+
+class PresenceAnalyzerLoadTestCase(unittest.TestCase):
+    """
+    Load-testing harness tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.workdir = tempfile.mkdtemp()
+        self.config = dict(main.app.config)
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        shutil.rmtree(self.workdir)
+        main.app.config.update(self.config)
+
+    def test_generate_presence_csv(self):
+        """
+        Test generated CSV is parsed by the application.
+        """
+        path = os.path.join(self.workdir, 'data.csv')
+        user_ids = loadtest.generate_presence_csv(path, users=3, days=14)
+        main.app.config.update({'DATA_CSV': path})
+        data = utils.get_data()
+        self.assertItemsEqual(data.keys(), user_ids)
+        for items in data.values():
+            for date, presence in items.items():
+                self.assertLess(date.weekday(), 5)
+                self.assertLessEqual(presence['start'], presence['end'])
+
+    def test_users_feed_server(self):
+        """
+        Test importing users data from the local stand-in server.
+        """
+        feed_path = os.path.join(self.workdir, 'feed.xml')
+        users_xml = os.path.join(self.workdir, 'users.xml')
+        loadtest.generate_users_xml(feed_path, [10, 11])
+        feed = loadtest.UsersFeedServer(feed_path).start()
+        try:
+            script.get_users_data(url=feed.url, path=users_xml)
+        finally:
+            feed.stop()
+        main.app.config.update({'DATA_USERS': users_xml})
+        self.assertItemsEqual(utils.get_users().keys(), ['10', '11'])
+
+    def test_percentile(self):
+        """
+        Test nearest-rank percentile.
+        """
+        self.assertEqual(loadtest.percentile([], 50), 0)
+        self.assertEqual(loadtest.percentile([3, 1, 2], 50), 2)
+        self.assertEqual(loadtest.percentile(range(1, 101), 90), 90)
+        self.assertEqual(loadtest.percentile(range(1, 101), 100), 100)
+
+    def test_build_requests(self):
+        """
+        Test drawing request mix.
+        """
+        paths = loadtest.build_requests([10, 11], 200)
+        self.assertEqual(len(paths), 200)
+        self.assertIn('/api/v1/presence_weekday/10', paths)
+        self.assertEqual(paths, loadtest.build_requests([10, 11], 200))
+
+    def test_request_mix(self):
+        """
+        Test every request of the mix is served.
+        """
+        main.app.config.update({
+            'DATA_CSV': TEST_DATA_CSV,
+            'DATA_USERS': TEST_DATA_USERS,
+            'MENU_CSV': TEST_MENU_CSV,
+        })
+        client = main.app.test_client()
+        for _, template in loadtest.REQUEST_MIX:
+            resp = client.get(template.format(user_id=10))
+            self.assertEqual(resp.status_code, 200, template)
+
+    def test_load_test(self):
+        """
+        Test running complete load test.
+        """
+        main.app.config.update({'MENU_CSV': TEST_MENU_CSV})
+        data_csv = main.app.config['DATA_CSV']
+        summary = loadtest.load_test(
+            users=2, days=7, total=20, concurrency=2, workdir=self.workdir
+        )
+        self.assertEqual(summary['requests'], 20)
+        self.assertEqual(summary['errors'], 0)
+        self.assertLessEqual(summary['p50'], summary['p99'])
+        self.assertEqual(main.app.config['DATA_CSV'], data_csv)
+        self.assertEqual(main.app.config['MENU_CSV'], TEST_MENU_CSV)
+
+
+class PresenceAnalyzerUsersDataTestCase(unittest.TestCase):
+    """
+    Users data refreshing tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.workdir = tempfile.mkdtemp()
+        self.feed_path = os.path.join(self.workdir, 'feed.xml')
+        self.path = os.path.join(self.workdir, 'users.xml')
+        loadtest.generate_users_xml(self.feed_path, [10, 11])
+        self.feed = loadtest.UsersFeedServer(self.feed_path).start()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        self.feed.stop()
+        shutil.rmtree(self.workdir)
+
+    def test_refresh_users_data(self):
+        """
+        Test downloading users data.
+        """
+        self.assertTrue(script.refresh_users_data(self.feed.url, self.path))
+        with open(self.feed_path) as feed, open(self.path) as downloaded:
+            self.assertEqual(feed.read(), downloaded.read())
+        self.assertItemsEqual(
+            os.listdir(self.workdir),
+            ['feed.xml', 'users.xml', 'users.xml.validators']
+        )
+
+    def test_refresh_users_data_not_modified(self):
+        """
+        Test conditional request does not replace unchanged file.
+        """
+        self.assertTrue(script.refresh_users_data(self.feed.url, self.path))
+        mtime = os.path.getmtime(self.path)
+        self.assertFalse(script.refresh_users_data(self.feed.url, self.path))
+        self.assertEqual(os.path.getmtime(self.path), mtime)
+        self.assertEqual(self.feed.hits, 2)
+
+        loadtest.generate_users_xml(self.feed_path, [10, 11, 12])
+        self.assertTrue(script.refresh_users_data(self.feed.url, self.path))
+        main.app.config.update({'DATA_USERS': self.path})
+        self.assertItemsEqual(utils.get_users().keys(), ['10', '11', '12'])
+
+    def test_refresh_users_data_invalid(self):
+        """
+        Test invalid download does not replace existing file.
+        """
+        self.assertTrue(script.refresh_users_data(self.feed.url, self.path))
+        with open(self.feed_path, 'w') as feed:
+            feed.write('<intranet><users>')
+        self.assertFalse(script.refresh_users_data(self.feed.url, self.path))
+        main.app.config.update({'DATA_USERS': self.path})
+        self.assertItemsEqual(utils.get_users().keys(), ['10', '11'])
+        self.assertItemsEqual(
+            os.listdir(self.workdir),
+            ['feed.xml', 'users.xml', 'users.xml.validators']
+        )
+
+    def test_refresh_users_data_closes_response(self):
+        """
+        Test streamed response is closed whatever the outcome.
+        """
+        missing = self.feed.url.replace('users.xml', 'missing.xml')
+        with patch.object(requests.Response, 'close',
+                          autospec=True) as close:
+            self.assertTrue(
+                script.refresh_users_data(self.feed.url, self.path)
+            )
+            self.assertFalse(
+                script.refresh_users_data(self.feed.url, self.path)
+            )
+            self.assertFalse(script.refresh_users_data(missing, self.path))
+            with open(self.feed_path, 'w') as feed:
+                feed.write('<intranet><users>')
+            self.assertFalse(
+                script.refresh_users_data(self.feed.url, self.path)
+            )
+        self.assertEqual(close.call_count, 4)
+
+    def test_refresh_users_data_unavailable(self):
+        """
+        Test failed request does not create the file.
+        """
+        url = self.feed.url.replace('users.xml', 'missing.xml')
+        self.assertFalse(script.refresh_users_data(url, self.path))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_schedule_users_data(self):
+        """
+        Test periodic refreshing stops when requested.
+        """
+        stop = threading.Event()
+        original = script.refresh_users_data
+
+        def refresh(url, path):
+            """
+            Stops scheduler after third refresh.
+            """
+            original(url, path)
+            if self.feed.hits == 3:
+                stop.set()
+
+        with patch.object(script, 'refresh_users_data', refresh):
+            script.schedule_users_data(0.01, self.feed.url, self.path, stop)
+        self.assertEqual(self.feed.hits, 3)
+        self.assertTrue(os.path.exists(self.path))
+
+
 def suite():
     """
     Default test suite.
@@ -332,6 +2361,23 @@ def suite():
     test_suite = unittest.TestSuite()
     test_suite.addTest(unittest.makeSuite(PresenceAnalyzerViewsTestCase))
     test_suite.addTest(unittest.makeSuite(PresenceAnalyzerUtilsTestCase))
+    test_suite.addTest(unittest.makeSuite(PresenceAnalyzerShardsTestCase))
+    test_suite.addTest(
+        unittest.makeSuite(PresenceAnalyzerCompressionTestCase)
+    )
+    test_suite.addTest(unittest.makeSuite(PresenceAnalyzerExportTestCase))
+    test_suite.addTest(unittest.makeSuite(PresenceAnalyzerImportTestCase))
+    test_suite.addTest(
+        unittest.makeSuite(PresenceAnalyzerEquivalenceTestCase)
+    )
+    test_suite.addTest(
+        unittest.makeSuite(PresenceAnalyzerAdminCommandsTestCase)
+    )
+    test_suite.addTest(unittest.makeSuite(PresenceAnalyzerStatsTestCase))
+    test_suite.addTest(unittest.makeSuite(PresenceAnalyzerLoadTestCase))
+    test_suite.addTest(
+        unittest.makeSuite(PresenceAnalyzerUsersDataTestCase)
+    )
     return test_suite
 
 
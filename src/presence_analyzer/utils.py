@@ -3,34 +3,198 @@
 Helper functions used in views.
 """
 
+import os
+import io
+import re
 import csv
-from lxml import etree
+import sys
+import glob
+import time
+import hmac
+import calendar
+import threading
+from array import array
 from json import dumps
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta, date as date_type
 
-from flask import Response
+from flask import Response, request, abort
 
 from presence_analyzer.main import app
+from presence_analyzer.stats import Distribution
 
 import logging
 log = logging.getLogger(__name__)  # pylint: disable=C0103
 
+ORGANIZATION_GROUP = 'all'
+
+SLOT_SECONDS = 15 * 60
+SLOTS_PER_DAY = 24 * 3600 // SLOT_SECONDS
+
+OVERNIGHT_MAX_SECONDS = 12 * 3600
+MAX_REPORTED_ITEMS = 100
+
+SHARD_NAME_RE = re.compile(r'(\d{4})-(\d{2})(?:-(\d{2}))?')
+# group names are URL path segments and exported file names
+GROUP_NAME_RE = re.compile(r'^(?!\.{1,2}$)[\w.-]+$')
+
+CACHE = {'version': None, 'entries': {}}
+SHARDS = {}
+# estimated memory of parsed shards, by shard version
+SHARD_SIZES = {}
+FILES = {}
+CACHE_LOCK = threading.Lock()
+
+# Identical API requests in flight share one computation; waiters give up
+# after COALESCE_TIMEOUT seconds.
+COALESCE_TIMEOUT = 30
+INFLIGHT = {}
+INFLIGHT_LOCK = threading.Lock()
+
+
+class _Flight(object):
+    """
+    Computation shared by concurrent callers of single_flight.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def single_flight(key, function, timeout=COALESCE_TIMEOUT):
+    """
+    Calls function once for all concurrent callers using the same key.
+
+    The first caller computes the result, callers arriving meanwhile wait
+    for it and receive the same result or exception. Waiters give up with
+    503 Service Unavailable after timeout seconds.
+    """
+    with INFLIGHT_LOCK:
+        flight = INFLIGHT.get(key)
+        leader = flight is None
+        if leader:
+            flight = INFLIGHT[key] = _Flight()
+
+    if not leader:
+        if not flight.done.wait(timeout):
+            log.warning('Timed out waiting for %r', key)
+            abort(503)
+        if flight.error is not None:
+            raise flight.error[0], flight.error[1], flight.error[2]
+        return flight.result
+
+    try:
+        flight.result = function()
+    except BaseException:
+        flight.error = sys.exc_info()
+        raise
+    finally:
+        with INFLIGHT_LOCK:
+            del INFLIGHT[key]
+        flight.done.set()
+    return flight.result
+
 
 def jsonify(function):
     """
     Creates a response with the JSON representation of wrapped function result.
+
+    Concurrent identical GET requests are serialized once and share
+    the result.
     """
     @wraps(function)
     def inner(*args, **kwargs):
         """
         Inner function of jsonify.
         """
-        return Response(dumps(function(*args, **kwargs)),
-                        mimetype='application/json')
+        def serialize():
+            """
+            Serializes wrapped function result.
+            """
+            return dumps(function(*args, **kwargs))
+
+        if request.method == 'GET':
+            key = (function.__module__, function.__name__, args,
+                   tuple(sorted(kwargs.items())), request.query_string)
+            content = single_flight(
+                key, serialize,
+                app.config.get('COALESCE_TIMEOUT', COALESCE_TIMEOUT)
+            )
+        else:
+            content = serialize()
+        return Response(content, mimetype='application/json')
     return inner
 
 
+def file_version(path):
+    """
+    Identifies current version of a file.
+    """
+    stat = os.stat(path)
+    return path, stat.st_mtime, stat.st_size
+
+
+def config_file_version(config_key):
+    """
+    Identifies current version of a file configured under config_key.
+
+    Files which are not configured or do not exist have no mtime and size.
+    """
+    path = app.config.get(config_key)
+    try:
+        return file_version(path)
+    except (OSError, TypeError):
+        return path, None, None
+
+
+def cache_by_file(*config_keys):
+    """
+    Caches wrapped function result until any file configured under
+    config_keys changes.
+
+    Cached result is shared between threads and must not be modified.
+    Undecorated function is available as uncached attribute, current
+    version of the files as version attribute.
+    """
+    cache_key = config_keys[0] if len(config_keys) == 1 else config_keys
+
+    def version():
+        """
+        Identifies current version of the files.
+        """
+        versions = tuple(config_file_version(key) for key in config_keys)
+        return versions[0] if len(versions) == 1 else versions
+
+    def decorator(function):
+        """
+        Decorator created by cache_by_file.
+        """
+        @wraps(function)
+        def inner():
+            """
+            Inner function of cache_by_file.
+            """
+            current = version()
+            with CACHE_LOCK:
+                cached = FILES.get(cache_key)
+            if cached is not None and cached[0] == current:
+                return cached[1]
+
+            result = function()
+            with CACHE_LOCK:
+                FILES[cache_key] = (current, result)
+            return result
+        inner.uncached = function
+        inner.version = version
+        inner.config_keys = config_keys
+        inner.cache_key = cache_key
+        return inner
+    return decorator
+
+
+@cache_by_file('MENU_CSV')
 def get_menu_data():
     """
     Extracts menu data from CSV file
@@ -53,13 +217,80 @@ def get_menu_data():
     return data
 
 
+def data_files():
+    """
+    Lists presence data files in merge order.
+
+    DATA_CSV may point at a single file, a directory of shard files or
+    a glob pattern matching them. Shards are merged in file name order.
+    """
+    path = app.config['DATA_CSV']
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if not name.startswith('.') and
+            os.path.isfile(os.path.join(path, name))
+        )
+    if glob.has_magic(path):
+        return sorted(glob.glob(path))
+    return [path]
+
+
+def data_version():
+    """
+    Identifies current version of presence data files.
+    """
+    return tuple(file_version(path) for path in data_files())
+
+
+def cache_by_data_version(function):
+    """
+    Caches wrapped function results until presence data file changes.
+
+    Cached results are shared between threads and must not be modified.
+    """
+    @wraps(function)
+    def inner(*args):
+        """
+        Inner function of cache_by_data_version.
+        """
+        version = data_version()
+        key = (function.__name__,) + args
+        with CACHE_LOCK:
+            if CACHE['version'] != version:
+                CACHE['version'] = version
+                CACHE['entries'] = {}
+            elif key in CACHE['entries']:
+                return CACHE['entries'][key]
+
+        result = function(*args)
+        with CACHE_LOCK:
+            if CACHE['version'] == version:
+                CACHE['entries'][key] = result
+        return result
+
+    def cached(*args):
+        """
+        Returns cached result for current data or None, computing nothing.
+        """
+        version = data_version()
+        with CACHE_LOCK:
+            if CACHE['version'] != version:
+                return None
+            return CACHE['entries'].get((function.__name__,) + args)
+
+    inner.cached = cached
+    inner.uncached = function
+    return inner
+
+
 @app.template_global()
 def get_menu(page_url):
     """
     Gets links and their titles.
     Adds 'selected' attribute to current page.
     """
-    pages = get_menu_data()
+    pages = [dict(page) for page in get_menu_data()]
 
     for page in pages:
         if page.get('link') == page_url:
@@ -69,10 +300,13 @@ def get_menu(page_url):
 
 
 @app.template_global()
+@cache_by_file('DATA_USERS')
 def get_users():
     """
     Gets dictionary with users data imported from xml file
     """
+    from lxml import etree
+
     data = etree.parse(app.config['DATA_USERS']).getroot()
     server = data.find('server')
     host = '{0}://{1}:{2}'.format(
@@ -91,31 +325,185 @@ def get_users():
     return users
 
 
-def get_data():
+@cache_by_file('DATA_GROUPS', 'DATA_USERS')
+def get_groups():
     """
-    Extracts presence data from CSV file and groups it by user_id.
+    Gets user groups defined in groups CSV file and users.xml attributes.
 
+    CSV rows are group name and user id pairs, users.xml users may have
+    comma separated group names in 'groups' attribute.
     It creates structure like this:
-    data = {
-        'user_id': {
-            datetime.date(2013, 10, 1): {
-                'start': datetime.time(9, 0, 0),
-                'end': datetime.time(17, 30, 0),
-            },
-            datetime.date(2013, 10, 2): {
-                'start': datetime.time(8, 30, 0),
-                'end': datetime.time(16, 45, 0),
-            },
-        }
+    groups = {
+        'backend': set([10, 11]),
     }
     """
+    groups = {}
+    groups_csv = app.config.get('DATA_GROUPS')
+    if groups_csv and os.path.exists(groups_csv):
+        with open(groups_csv, 'r') as csvfile:
+            for i, row in enumerate(csv.reader(csvfile, delimiter=',')):
+                try:
+                    name, user_id = row[0].strip(), int(row[1])
+                except (IndexError, ValueError):
+                    log.debug('Problem with group line %d: ', i, exc_info=True)
+                    continue
+                if not GROUP_NAME_RE.match(name):
+                    log.warning('Invalid group name %r in line %d', name, i)
+                    continue
+                groups.setdefault(name, set()).add(user_id)
+
+    users_xml = app.config.get('DATA_USERS')
+    if users_xml and os.path.exists(users_xml):
+        from lxml import etree
+
+        data_users = etree.parse(users_xml).getroot().find('users')
+        if data_users is None:
+            log.debug('No users in %s', users_xml)
+            data_users = []
+        for user in data_users:
+            names = [
+                name.strip()
+                for name in (user.get('groups') or '').split(',')
+                if name.strip()
+            ]
+            if not names:
+                continue
+            try:
+                user_id = int(user.get('id'))
+            except (TypeError, ValueError):
+                log.debug('Problem with user %r: ', user.get('id'),
+                          exc_info=True)
+                continue
+            for name in names:
+                if not GROUP_NAME_RE.match(name):
+                    log.warning('Invalid group name %r of user %d',
+                                name, user_id)
+                    continue
+                groups.setdefault(name, set()).add(user_id)
+
+    return groups
+
+
+def shard_period(path):
+    """
+    Gets first and last day covered by a shard from its file name.
+
+    Recognizes monthly (2013-09) and daily (2013-09-10) shard names.
+    Returns None if the name does not tell.
+    """
+    match = SHARD_NAME_RE.search(os.path.basename(path))
+    if match is None:
+        return None
+    year, month, day = match.groups()
+    try:
+        if day is not None:
+            first = last = date_type(int(year), int(month), int(day))
+        else:
+            first = date_type(int(year), int(month), 1)
+            last = first.replace(
+                day=calendar.monthrange(first.year, first.month)[1]
+            )
+    except ValueError:
+        return None
+    return first, last
+
+
+def get_lzma():
+    """
+    Imports lzma module. Returns None if it is not available.
+    """
+    try:
+        import lzma
+    except ImportError:  # pragma: no cover
+        try:
+            from backports import lzma
+        except ImportError:
+            return None
+    return lzma
+
+
+def open_data_file(path):
+    """
+    Opens data file for reading, decompressing it on the fly.
+
+    Compression is recognized by .gz, .bz2 and .xz extension. Decompressed
+    lines are streamed to the reader, the file is never inflated in memory.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.gz':
+        import gzip
+        return io.BufferedReader(gzip.open(path, 'rb'))
+    if extension == '.bz2':
+        import bz2
+        return bz2.BZ2File(path, 'r')
+    if extension == '.xz':
+        lzma = get_lzma()
+        if lzma is None:
+            raise IOError(
+                'Reading {0} requires lzma module (backports.lzma)'.format(
+                    path
+                )
+            )
+        return lzma.LZMAFile(path, 'r')
+    return open(path, 'r')
+
+
+def new_quality_report():
+    """
+    Creates empty data quality report.
+    """
+    return {
+        'lines': 0,
+        'rows': 0,
+        'headers': 0,
+        'malformed': 0,
+        'malformed_lines': [],
+        'negative': 0,
+        'zero': 0,
+        'overnight': 0,
+        'duplicates': 0,
+        'duplicate_rows': [],
+        'last_date': None,
+    }
+
+
+def report_item(items, item):
+    """
+    Appends item to a report list unless it is already full.
+    """
+    if len(items) < MAX_REPORTED_ITEMS:
+        items.append(item)
+
+
+def parse_presence_csv(path):
+    """
+    Extracts presence data from single CSV file and groups it by user_id.
+
+    Later lines win over earlier lines for the same user and date.
+    Data quality report is collected in the same pass: header line,
+    malformed lines, zero, negative and overnight (end before start, at
+    most OVERNIGHT_MAX_SECONDS long when wrapped over midnight) presences,
+    last date and duplicate user/date rows with the lines that won.
+    Returns data and report.
+    """
     data = {}
+    lines = {}
+    report = new_quality_report()
+    last_date = None
 
-    with open(app.config['DATA_CSV'], 'r') as csvfile:
+    with open_data_file(path) as csvfile:
         presence_reader = csv.reader(csvfile, delimiter=',')
         for i, row in enumerate(presence_reader):
+            line = i + 1
+            report['lines'] = line
+            if line == 1 and not any(field[:1].isdigit() for field in row):
+                # column names
+                report['headers'] += 1
+                continue
+
             if len(row) != 4:
-                # ignore header and footer lines
+                report['malformed'] += 1
+                report_item(report['malformed_lines'], line)
                 continue
 
             try:
@@ -123,12 +511,232 @@ def get_data():
                 date = datetime.strptime(row[1], '%Y-%m-%d').date()
                 start = datetime.strptime(row[2], '%H:%M:%S').time()
                 end = datetime.strptime(row[3], '%H:%M:%S').time()
-                data.setdefault(user_id, {})[date] = {
-                    'start': start,
-                    'end': end
-                }
             except (ValueError, TypeError):
                 log.debug('Problem with line %d: ', i, exc_info=True)
+                report['malformed'] += 1
+                report_item(report['malformed_lines'], line)
+                continue
+
+            report['rows'] += 1
+            duration = interval(start, end)
+            if duration == 0:
+                report['zero'] += 1
+            elif duration < 0:
+                if duration + 24 * 3600 <= OVERNIGHT_MAX_SECONDS:
+                    report['overnight'] += 1
+                else:
+                    report['negative'] += 1
+            if last_date is None or date > last_date:
+                last_date = date
+
+            key = (user_id, date)
+            if key in lines:
+                report['duplicates'] += 1
+                report_item(report['duplicate_rows'], {
+                    'user_id': user_id,
+                    'date': date.isoformat(),
+                    'kept': [path, line],
+                    'dropped': [path, lines[key]],
+                })
+            lines[key] = line
+            data.setdefault(user_id, {})[date] = {
+                'start': start,
+                'end': end
+            }
+
+    if last_date is not None:
+        report['last_date'] = last_date.isoformat()
+    return data, report
+
+
+def load_shard(path):
+    """
+    Gets parsed presence data and quality report of a shard.
+
+    The shard is parsed again only when it changed.
+    """
+    version = file_version(path)
+    with CACHE_LOCK:
+        shard = SHARDS.get(path)
+    if shard is not None and shard[0] == version:
+        return shard[1]
+
+    shard = parse_shard(path)
+    with CACHE_LOCK:
+        SHARDS[path] = shard
+    return shard[1]
+
+
+def parse_shard(path):
+    """
+    Parses a shard.
+
+    Returns its version, parsed content and parse duration.
+    """
+    version = file_version(path)
+    started = time.time()
+    parsed = parse_presence_csv(path)
+    duration = time.time() - started
+    return version, parsed, duration
+
+
+def evict_shards(paths):
+    """
+    Drops cached shards whose paths are not among given ones.
+    """
+    paths = set(paths)
+    with CACHE_LOCK:
+        for path in list(SHARDS):
+            if path not in paths:
+                del SHARDS[path]
+
+
+def get_shard(path):
+    """
+    Gets parsed presence data of a shard.
+    """
+    return load_shard(path)[0]
+
+
+def get_quality_report():
+    """
+    Gets data quality report of all shards.
+
+    Rows dated after today are counted on every call, so the count does
+    not depend on the day a shard was parsed; only shards whose last date
+    is in the future are scanned.
+    """
+    merged = merge_quality_reports()
+    report = dict(merged, files={}, future=0)
+    today = date_type.today().isoformat()
+    for path, shard_report in merged['files'].items():
+        shard_report = report['files'][path] = dict(shard_report, future=0)
+        if (shard_report['last_date'] is not None and
+                shard_report['last_date'] > today):
+            shard_report['future'] = sum(
+                1
+                for items in get_shard(path).values()
+                for date in items
+                if date.isoformat() > today
+            )
+            report['future'] += shard_report['future']
+    return report
+
+
+@cache_by_data_version
+def merge_quality_reports():
+    """
+    Merges data quality reports of all shards.
+
+    Duplicates between shards are found from user dates of already parsed
+    shards, so no data file is read again; their line numbers are not
+    tracked and reported as None.
+    """
+    report = new_quality_report()
+    report['files'] = {}
+    winners = {}
+    for path in data_files():
+        data, shard_report = load_shard(path)
+        report['files'][path] = shard_report
+        for name, value in shard_report.items():
+            if name == 'duplicate_rows':
+                for item in value:
+                    report_item(report[name], item)
+            elif name == 'last_date':
+                if value is not None and value > report[name]:
+                    report[name] = value
+            elif name != 'malformed_lines':
+                report[name] += value
+
+        for user_id, items in data.items():
+            dates = winners.setdefault(user_id, {})
+            for date in items:
+                if date in dates:
+                    report['duplicates'] += 1
+                    report_item(report['duplicate_rows'], {
+                        'user_id': user_id,
+                        'date': date.isoformat(),
+                        'kept': [path, None],
+                        'dropped': [dates[date], None],
+                    })
+                dates[date] = path
+
+    report['malformed_lines'] = [
+        [path, line]
+        for path, shard_report in sorted(report['files'].items())
+        for line in shard_report['malformed_lines']
+    ][:MAX_REPORTED_ITEMS]
+    return report
+
+
+def get_data(date_from=None, date_to=None):
+    """
+    Extracts presence data from CSV files and groups it by user_id.
+
+    Only shards overlapping given date range are loaded and only dates
+    within it are returned. Later shards win over earlier ones for the same
+    user and date. Data of all dates is cached; ranged results are merged
+    from cached shards on every call, so ranges chosen by clients do not
+    grow the cache.
+
+    It creates structure like this:
+    data = {
+        'user_id': {
+            datetime.date(2013, 10, 1): {
+                'start': datetime.time(9, 0, 0),
+                'end': datetime.time(17, 30, 0),
+            },
+            datetime.date(2013, 10, 2): {
+                'start': datetime.time(8, 30, 0),
+                'end': datetime.time(16, 45, 0),
+            },
+        }
+    }
+    """
+    if date_from is None and date_to is None:
+        return get_all_data()
+    return merge_shards(date_from, date_to)
+
+
+@cache_by_data_version
+def get_all_data():
+    """
+    Merges presence data of all shards.
+    """
+    return merge_shards()
+
+
+def merge_shards(date_from=None, date_to=None, user_id=None):
+    """
+    Merges presence data of shards overlapping given date range.
+
+    Only data of given user is merged when user_id is given.
+    Shards which are no longer listed in data files are dropped from memory.
+    """
+    paths = data_files()
+    evict_shards(paths)
+    data = {}
+
+    for path in paths:
+        period = shard_period(path)
+        if period is not None and (
+                (date_from is not None and period[1] < date_from) or
+                (date_to is not None and period[0] > date_to)):
+            continue
+        shard = get_shard(path)
+        if user_id is not None:
+            shard = {user_id: shard[user_id]} if user_id in shard else {}
+        for shard_user_id, items in shard.items():
+            if date_from is None and date_to is None:
+                data.setdefault(shard_user_id, {}).update(items)
+                continue
+            items = {
+                date: presence for date, presence in items.items()
+                if (date_from is None or date >= date_from) and
+                (date_to is None or date <= date_to)
+            }
+            if items:
+                data.setdefault(shard_user_id, {}).update(items)
 
     return data
 
@@ -166,6 +774,100 @@ def mean(items):
     return float(sum(items)) / len(items) if len(items) > 0 else 0
 
 
+def time_cell(seconds):
+    """
+    Builds DataTable datetime cell of given time of day.
+
+    Value uses DataTable JSON date string syntax on a fixed day, formatted
+    value is HH:MM:SS, so charts need no client-side conversion. Times
+    outside of a day, e.g. negative means of rows ending before their
+    start, are clamped to it.
+    """
+    seconds = min(max(int(round(seconds)), 0), 24 * 3600 - 1)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return {
+        'v': 'Date(1970,0,1,{0},{1},{2})'.format(hours, minutes, seconds),
+        'f': '{0:02d}:{1:02d}:{2:02d}'.format(hours, minutes, seconds),
+    }
+
+
+def datatable(columns, rows):
+    """
+    Builds Google Visualization DataTable JSON.
+
+    Columns are (type, label) tuples. Row values which are dictionaries
+    are used as cells, other values are wrapped as plain cell values.
+    """
+    return {
+        'cols': [{'type': kind, 'label': label} for kind, label in columns],
+        'rows': [
+            {'c': [
+                value if isinstance(value, dict) else {'v': value}
+                for value in row
+            ]}
+            for row in rows
+        ],
+    }
+
+
+def date_value(day):
+    """
+    Formats date as DataTable JSON date string, with zero-based month.
+    """
+    return 'Date({0},{1},{2})'.format(day.year, day.month - 1, day.day)
+
+
+def downsample(rows, resolution=None):
+    """
+    Averages consecutive rows into at most resolution rows.
+
+    Rows start with a label followed by numbers; every bucket keeps label
+    of its first row and mean of its numbers. Rows are returned unchanged
+    when resolution is not given or not exceeded.
+    """
+    if not resolution or resolution < 1 or len(rows) <= resolution:
+        return rows
+    size = -(-len(rows) // resolution)
+    result = []
+    for index in range(0, len(rows), size):
+        bucket = rows[index:index + size]
+        result.append([bucket[0][0]] + [
+            float(sum(values)) / len(bucket)
+            for values in zip(*bucket)[1:]
+        ])
+    return result
+
+
+def calendar_buckets(start, values, resolution=None):
+    """
+    Sums daily values by day, week or month.
+
+    The finest bucket giving at most resolution buckets over the range is
+    used; weeks start on Monday. Buckets without presence are left out.
+    Returns bucket name and list of (first day, sum) pairs.
+    """
+    first = start.toordinal()
+    last = start + timedelta(days=len(values) - 1) if values else start
+    monday = first - start.weekday()
+    weeks = (last.toordinal() - monday) // 7 + 1
+    months = (last.year - start.year) * 12 + last.month - start.month + 1
+
+    if not resolution or resolution < 1 or len(values) <= resolution:
+        bucket, key = 'day', lambda day: day
+    elif weeks <= resolution:
+        bucket, key = 'week', lambda day: day - timedelta(day.weekday())
+    else:
+        bucket, key = 'month', lambda day: day.replace(day=1)
+
+    sums = {}
+    for index, value in enumerate(values):
+        if value:
+            day = key(date_type.fromordinal(first + index))
+            sums[day] = sums.get(day, 0) + value
+    return bucket, sorted(sums.items())
+
+
 def group_by_weekday_start_end(items):
     """
     Groups start and end presences by weekday.
@@ -201,3 +903,434 @@ def presence_start_end(items):
     }
 
     return result
+
+
+def occupancy(user_ids=None):
+    """
+    Gets mean number of present users per time slot by weekday.
+
+    Result of all users is cached; subsets chosen by clients are
+    calculated on every call so they cannot grow the cache.
+    """
+    if user_ids is None:
+        return organization_occupancy()
+    return calculate_occupancy(user_ids)
+
+
+@cache_by_data_version
+def organization_occupancy():
+    """
+    Calculates occupancy of all users.
+    """
+    return calculate_occupancy(get_data().keys())
+
+
+def calculate_occupancy(user_ids):
+    """
+    Calculates mean number of present users per time slot by weekday.
+
+    Every presence adds one at its first slot and subtracts one after its
+    last slot, so a single prefix sum per weekday yields the occupancy.
+    Means are taken over days on which anybody from given users was present.
+
+    It creates structure like this:
+    result = {
+        0: [0.0, 0.0, ..., 3.5, 4.0, ...],  # SLOTS_PER_DAY values
+        ...
+    }
+    """
+    data = get_data()
+    deltas = {i: [0] * (SLOTS_PER_DAY + 1) for i in range(7)}
+    dates = {i: set() for i in range(7)}
+    for user_id in user_ids:
+        for date, presence in data.get(user_id, {}).items():
+            start = seconds_since_midnight(presence['start'])
+            end = seconds_since_midnight(presence['end'])
+            if end <= start:
+                continue
+            weekday = date.weekday()
+            dates[weekday].add(date)
+            deltas[weekday][start // SLOT_SECONDS] += 1
+            deltas[weekday][(end - 1) // SLOT_SECONDS + 1] -= 1
+
+    result = {}
+    for weekday, slots in deltas.items():
+        days = len(dates[weekday]) or 1
+        present = 0
+        result[weekday] = []
+        for delta in slots[:SLOTS_PER_DAY]:
+            present += delta
+            result[weekday].append(float(present) / days)
+    return result
+
+
+def empty_distributions():
+    """
+    Creates empty distributions of presence duration, start and end
+    by weekday.
+    """
+    return {
+        i: {
+            'duration': Distribution(),
+            'start': Distribution(),
+            'end': Distribution(),
+        }
+        for i in range(7)
+    }
+
+
+@cache_by_data_version
+def get_distributions():
+    """
+    Builds per-user weekday distributions and their organization total.
+
+    All users are processed in a single pass, so organization requests
+    do not look up cached distributions of every user separately.
+    It creates structure like this:
+    users, total = {
+        10: {
+            0: {
+                'duration': Distribution(),
+                'start': Distribution(),
+                'end': Distribution(),
+            },
+            ...
+        },
+    }, {
+        0: {...},
+        ...
+    }
+    """
+    users = {}
+    total = empty_distributions()
+    for user_id, items in get_data().items():
+        result = users[user_id] = empty_distributions()
+        for date, presence in items.items():
+            start = seconds_since_midnight(presence['start'])
+            end = seconds_since_midnight(presence['end'])
+            weekday = result[date.weekday()]
+            weekday['duration'].add(end - start)
+            weekday['start'].add(start)
+            weekday['end'].add(end)
+        for weekday, distributions in result.items():
+            for name, distribution in distributions.items():
+                total[weekday][name].merge(distribution)
+    return users, total
+
+
+def weekday_distributions(user_id=None):
+    """
+    Returns distributions of presence duration, start and end by weekday.
+
+    Distributions of all users are merged when user_id is not given.
+    It creates structure like this:
+    result = {
+        0: {
+            'duration': Distribution(),
+            'start': Distribution(),
+            'end': Distribution(),
+        },
+        ...
+    }
+    """
+    users, total = get_distributions()
+    if user_id is None:
+        return total
+    if user_id not in users:
+        return empty_distributions()
+    return users[user_id]
+
+
+@cache_by_data_version
+def get_partials():
+    """
+    Computes per-user partial sums by weekday and their organization total.
+
+    Partials of a weekday are presence count, total presence time, total
+    start time and total end time; group aggregates are sums of partials
+    of their members, so no presence rows are scanned again.
+    It creates structure like this:
+    users, total = {
+        10: {
+            0: [2, 57600, 64800, 122400],
+            ...
+        },
+    }, {
+        0: [...],
+        ...
+    }
+    """
+    users = {}
+    total = {i: [0, 0, 0, 0] for i in range(7)}
+    for user_id, items in get_data().items():
+        partials = users[user_id] = {i: [0, 0, 0, 0] for i in range(7)}
+        for date, presence in items.items():
+            start = seconds_since_midnight(presence['start'])
+            end = seconds_since_midnight(presence['end'])
+            partial = partials[date.weekday()]
+            partial[0] += 1
+            partial[1] += end - start
+            partial[2] += start
+            partial[3] += end
+        for weekday, partial in partials.items():
+            total[weekday] = [a + b for a, b in zip(total[weekday], partial)]
+    return users, total
+
+
+@cache_by_data_version
+def group_partials(user_ids=None):
+    """
+    Sums partials of given users by weekday.
+
+    Returns precomputed organization total when user_ids is not given.
+    """
+    users, total = get_partials()
+    if user_ids is None:
+        return total
+
+    result = {i: [0, 0, 0, 0] for i in range(7)}
+    for user_id in user_ids:
+        for weekday, partial in users.get(user_id, {}).items():
+            result[weekday] = [a + b for a, b in zip(result[weekday], partial)]
+    return result
+
+
+def get_group_partials(name):
+    """
+    Gets summed partials of group with given name.
+
+    ORGANIZATION_GROUP stands for all users. Returns None for unknown groups.
+    """
+    if name == ORGANIZATION_GROUP:
+        return group_partials()
+
+    groups = get_groups()
+    if name not in groups:
+        return None
+    return group_partials(tuple(sorted(groups[name])))
+
+
+def calendar_values(items):
+    """
+    Builds dense array of daily presence time in minutes of a user.
+
+    Array starts at the first presence day and has one value per day up to
+    the last one, zero for days without presence.
+    Returns ordinal of the first day and the array.
+    """
+    first = min(items).toordinal()
+    values = array('i', [0]) * (max(items).toordinal() - first + 1)
+    for date, presence in items.items():
+        values[date.toordinal() - first] = int(round(
+            interval(presence['start'], presence['end']) / 60.0
+        ))
+    return first, values
+
+
+@cache_by_data_version
+def get_calendar_index():
+    """
+    Builds dense arrays of daily presence time in minutes per user.
+
+    Any date range of a user is a single slice of its array.
+    It creates structure like this:
+    index = {
+        10: (735121, array('i', [512, 0, 0, 487, ...])),
+    }
+    """
+    return {
+        user_id: calendar_values(items)
+        for user_id, items in get_data().items()
+    }
+
+
+def presence_calendar(user_id, date_from=None, date_to=None):
+    """
+    Gets daily presence time in minutes of given user within date range.
+
+    Given range is clamped to the user's first and last day with presence
+    time within it, so its size is bounded by the data whatever dates are
+    requested. The cached index is sliced whenever it is built; otherwise
+    ranged requests load only shards overlapping the range and only data
+    of the user.
+    Returns first day of the range and list of values, one per day,
+    or None if the user has no presence time in the range.
+    """
+    index = get_calendar_index.cached()
+    if index is None and date_from is None and date_to is None:
+        index = get_calendar_index()
+    if index is not None:
+        if user_id not in index:
+            return None
+        first, values = index[user_id]
+        if date_from is None and date_to is None:
+            return date_type.fromordinal(first), values.tolist()
+    else:
+        items = merge_shards(date_from, date_to, user_id).get(user_id)
+        if not items:
+            return None
+        first, values = calendar_values(items)
+
+    start, stop = first, first + len(values)
+    if date_from is not None:
+        start = max(start, date_from.toordinal())
+    if date_to is not None:
+        stop = min(stop, date_to.toordinal() + 1)
+    while start < stop and not values[start - first]:
+        start += 1
+    while start < stop and not values[stop - 1 - first]:
+        stop -= 1
+    if stop <= start:
+        return None
+    return (
+        date_type.fromordinal(start),
+        values[start - first:stop - first].tolist(),
+    )
+
+
+def admin_required(function):
+    """
+    Restricts wrapped view to requests with ADMIN_TOKEN.
+
+    Token is read from X-Admin-Token header. Admin views are disabled
+    when ADMIN_TOKEN is not configured.
+    """
+    @wraps(function)
+    def inner(*args, **kwargs):
+        """
+        Inner function of admin_required.
+        """
+        token = app.config.get('ADMIN_TOKEN')
+        given = request.headers.get('X-Admin-Token', '')
+        if not token or not hmac.compare_digest(str(token), str(given)):
+            abort(403)
+        return function(*args, **kwargs)
+    return inner
+
+
+def estimate_size(value, seen=None):
+    """
+    Estimates memory used by value and objects it contains, in bytes.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key, seen) + estimate_size(item, seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item, seen)
+    return size
+
+
+def file_state(config_key):
+    """
+    Describes cached state of file configured under config_key.
+    """
+    path = app.config.get(config_key)
+    with CACHE_LOCK:
+        cached = FILES.get(config_key)
+    state = {'path': path, 'loaded': cached is not None}
+    if cached is not None:
+        state.update(mtime=cached[0][1], size=cached[0][2])
+    return state
+
+
+def cache_state():
+    """
+    Describes loaded presence data, users.xml and menu caches.
+
+    Memory used by a shard is estimated on first request of the state and
+    reused until the shard changes.
+    """
+    with CACHE_LOCK:
+        shards = dict(SHARDS)
+        sizes = dict(SHARD_SIZES)
+        results = len(CACHE['entries'])
+
+    files = []
+    users = set()
+    for path in data_files():
+        shard = shards.get(path)
+        state = {'path': path, 'loaded': shard is not None}
+        if shard is not None:
+            version, parsed, duration = shard
+            _, mtime, size = version
+            data, report = parsed
+            if version not in sizes:
+                sizes[version] = estimate_size(parsed)
+            memory = sizes[version]
+            users.update(data)
+            state.update(
+                mtime=mtime,
+                size=size,
+                rows=report['rows'],
+                users=len(data),
+                load_duration=duration,
+                memory_bytes=memory,
+            )
+        files.append(state)
+
+    with CACHE_LOCK:
+        SHARD_SIZES.clear()
+        SHARD_SIZES.update(
+            (shard[0], sizes[shard[0]])
+            for shard in shards.values() if shard[0] in sizes
+        )
+
+    loaded = [state for state in files if state['loaded']]
+    return {
+        'data': {
+            'path': app.config['DATA_CSV'],
+            'files': files,
+            'rows': sum(state['rows'] for state in loaded),
+            'users': len(users),
+            'load_duration': sum(state['load_duration'] for state in loaded),
+            'memory_bytes': sum(state['memory_bytes'] for state in loaded),
+            'cached_results': results,
+        },
+        'users': file_state('DATA_USERS'),
+        'menu': file_state('MENU_CSV'),
+    }
+
+
+def flush_caches():
+    """
+    Drops all cached data; it is loaded again on next use.
+    """
+    with CACHE_LOCK:
+        CACHE['version'] = None
+        CACHE['entries'] = {}
+        SHARDS.clear()
+        SHARD_SIZES.clear()
+        FILES.clear()
+
+
+def reload_caches():
+    """
+    Loads presence data, users.xml, menu and groups again and swaps them
+    in.
+
+    Files are parsed before the swap, so requests served meanwhile use
+    previously cached data instead of waiting or parsing themselves.
+    """
+    shards = {path: parse_shard(path) for path in data_files()}
+    files = {}
+    for function in [get_users, get_menu_data, get_groups]:
+        if all(app.config.get(key) for key in function.config_keys):
+            files[function.cache_key] = (
+                function.version(), function.uncached()
+            )
+
+    with CACHE_LOCK:
+        CACHE['version'] = None
+        CACHE['entries'] = {}
+        SHARDS.clear()
+        SHARDS.update(shards)
+        SHARD_SIZES.clear()
+        FILES.clear()
+        FILES.update(files)
+    get_data()
@@ -4,11 +4,16 @@ Defines views.
 """
 
 import calendar
-from flask import render_template
+from datetime import datetime
+from flask import render_template, request, abort
 
 from presence_analyzer.main import app
 from presence_analyzer.utils import (
-    jsonify, get_data, mean, group_by_weekday, presence_start_end)
+    jsonify, get_data, mean, group_by_weekday, presence_start_end, occupancy,
+    weekday_distributions, get_groups, get_group_partials, get_quality_report,
+    presence_calendar, admin_required, cache_state, flush_caches,
+    reload_caches, datatable, time_cell, date_value, downsample,
+    calendar_buckets, SLOT_SECONDS, ORGANIZATION_GROUP)
 
 import logging
 log = logging.getLogger(__name__)  # pylint: disable=C0103
@@ -40,6 +45,23 @@ def presence_start_end_route():
         'presence_start_end.html', page_url='presence_start_end_route')
 
 
+@app.route('/occupancy')
+def occupancy_route():
+    """
+    Renders occupancy page
+    """
+    return render_template('occupancy.html', page_url='occupancy_route')
+
+
+@app.route('/presence_calendar')
+def presence_calendar_route():
+    """
+    Renders presence_calendar page
+    """
+    return render_template(
+        'presence_calendar.html', page_url='presence_calendar_route')
+
+
 @app.route('/api/v1/users', methods=['GET'])
 @jsonify
 def users_view():
@@ -108,3 +130,313 @@ def presence_start_end_view(user_id):
     ]
 
     return result
+
+
+@app.route('/api/v1/occupancy', methods=['GET'])
+@jsonify
+def occupancy_view():
+    """
+    Returns mean number of present users per time slot by weekday.
+
+    Optional user_id query arguments limit it to given users. Optional
+    resolution query argument limits number of rows; adjacent slots are
+    averaged, so no more rows are sent than the chart can draw.
+    """
+    rows = downsample(
+        occupancy_rows(), request.args.get('resolution', type=int)
+    )
+    result = [['Time'] + list(calendar.day_abbr)]
+    result.extend(
+        [row[0]] + [round(value, 2) for value in row[1:]]
+        for row in rows
+    )
+    return result
+
+
+def occupancy_rows():
+    """
+    Lists (time, occupancy by weekday...) rows, one per time slot.
+
+    Optional user_id query arguments limit it to given users.
+    """
+    user_ids = request.args.getlist('user_id', type=int)
+    slots = occupancy(tuple(sorted(set(user_ids))) if user_ids else None)
+
+    rows = []
+    for slot in range(len(slots[0])):
+        seconds = slot * SLOT_SECONDS
+        rows.append(
+            ['{0:02d}:{1:02d}'.format(seconds // 3600, seconds % 3600 // 60)] +
+            [slots[weekday][slot] for weekday in range(7)]
+        )
+    return rows
+
+
+@app.route('/api/v1/presence_stats', methods=['GET'])
+@app.route('/api/v1/presence_stats/<int:user_id>', methods=['GET'])
+@jsonify
+def presence_stats_view(user_id=None):
+    """
+    Returns presence time statistics of given or all users by weekday.
+    """
+    if user_id is not None and user_id not in get_data():
+        log.debug('User %s not found!', user_id)
+        return []
+
+    weekdays = weekday_distributions(user_id)
+    result = [
+        (calendar.day_abbr[weekday], distributions['duration'].summary())
+        for weekday, distributions in weekdays.items()
+    ]
+
+    return result
+
+
+@app.route('/api/v1/start_end_stats', methods=['GET'])
+@app.route('/api/v1/start_end_stats/<int:user_id>', methods=['GET'])
+@jsonify
+def start_end_stats_view(user_id=None):
+    """
+    Returns start and end time statistics of given or all users by weekday.
+    """
+    if user_id is not None and user_id not in get_data():
+        log.debug('User %s not found!', user_id)
+        return []
+
+    weekdays = weekday_distributions(user_id)
+    result = [
+        (calendar.day_abbr[weekday], {
+            'start': distributions['start'].summary(),
+            'end': distributions['end'].summary(),
+        })
+        for weekday, distributions in weekdays.items()
+    ]
+
+    return result
+
+
+@app.route('/api/v1/groups', methods=['GET'])
+@jsonify
+def groups_view():
+    """
+    Groups listing, starting with the whole organization.
+    """
+    groups = get_groups()
+    result = [{'name': ORGANIZATION_GROUP, 'size': len(get_data())}]
+    result.extend(
+        {'name': name, 'size': len(user_ids)}
+        for name, user_ids in sorted(groups.items())
+        if name != ORGANIZATION_GROUP
+    )
+    return result
+
+
+@app.route('/api/v1/groups/<group>/mean_time_weekday', methods=['GET'])
+@jsonify
+def group_mean_time_weekday_view(group):
+    """
+    Returns mean presence time of given group grouped by weekday.
+    """
+    partials = get_group_partials(group)
+    if partials is None:
+        log.debug('Group %s not found!', group)
+        return []
+
+    result = [
+        (calendar.day_abbr[weekday],
+         float(partial[1]) / partial[0] if partial[0] else 0)
+        for weekday, partial in partials.items()
+    ]
+
+    return result
+
+
+@app.route('/api/v1/groups/<group>/presence_weekday', methods=['GET'])
+@jsonify
+def group_presence_weekday_view(group):
+    """
+    Returns total presence time of given group grouped by weekday.
+    """
+    partials = get_group_partials(group)
+    if partials is None:
+        log.debug('Group %s not found!', group)
+        return []
+
+    result = [
+        (calendar.day_abbr[weekday], partial[1])
+        for weekday, partial in partials.items()
+    ]
+
+    result.insert(0, ('Weekday', 'Presence (s)'))
+    return result
+
+
+@app.route('/api/v1/groups/<group>/presence_start_end', methods=['GET'])
+@jsonify
+def group_presence_start_end_view(group):
+    """
+    Returns mean start and end presence time of given group by weekday.
+    """
+    partials = get_group_partials(group)
+    if partials is None:
+        log.debug('Group %s not found!', group)
+        return []
+
+    result = [
+        (calendar.day_abbr[weekday],
+         partial[2] // partial[0] if partial[0] else 0,
+         partial[3] // partial[0] if partial[0] else 0)
+        for weekday, partial in partials.items()
+    ]
+
+    return result
+
+
+@app.route('/admin/data_quality', methods=['GET'])
+@admin_required
+@jsonify
+def data_quality_view():
+    """
+    Returns quality report of presence data collected while loading it.
+    """
+    return get_quality_report()
+
+
+def parse_date(value):
+    """
+    Parses YYYY-MM-DD date. Returns None for empty values.
+
+    Aborts with 400 Bad Request for invalid ones.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        log.debug('Invalid date %r', value)
+        abort(400)
+
+
+@app.route('/api/v1/presence_calendar/<int:user_id>', methods=['GET'])
+@jsonify
+def presence_calendar_view(user_id):
+    """
+    Returns daily presence time in minutes of given user.
+
+    Optional from and to query arguments (YYYY-MM-DD) limit the range,
+    which never extends past the user's first and last presence day in it.
+    Values are dense, one per day starting at returned start date.
+    """
+    date_from = parse_date(request.args.get('from'))
+    date_to = parse_date(request.args.get('to'))
+    result = presence_calendar(user_id, date_from, date_to)
+    if result is None:
+        log.debug('User %s not found!', user_id)
+        return []
+
+    start, values = result
+    return {'start': start.isoformat(), 'minutes': values}
+
+
+@app.route('/api/v1/charts/mean_time_weekday/<int:user_id>',
+           methods=['GET'])
+@jsonify
+def mean_time_weekday_chart_view(user_id):
+    """
+    Returns mean presence time of given user by weekday as DataTable.
+    """
+    columns = [('string', 'Weekday'), ('datetime', 'Mean time (h:m:s)')]
+    data = get_data()
+    if user_id not in data:
+        log.debug('User %s not found!', user_id)
+        return datatable(columns, [])
+
+    weekdays = group_by_weekday(data[user_id])
+    return datatable(columns, [
+        (calendar.day_abbr[weekday], time_cell(mean(intervals)))
+        for weekday, intervals in weekdays.items()
+    ])
+
+
+@app.route('/api/v1/charts/presence_start_end/<int:user_id>',
+           methods=['GET'])
+@jsonify
+def presence_start_end_chart_view(user_id):
+    """
+    Returns mean start and end of given user by weekday as DataTable.
+    """
+    columns = [('string', 'Weekday'), ('datetime', 'Start'),
+               ('datetime', 'End')]
+    data = get_data()
+    if user_id not in data:
+        log.debug('User %s not found!', user_id)
+        return datatable(columns, [])
+
+    weekdays = presence_start_end(data[user_id])
+    return datatable(columns, [
+        (calendar.day_abbr[weekday], time_cell(date_time['start']),
+         time_cell(date_time['end']))
+        for weekday, date_time in weekdays.items()
+    ])
+
+
+@app.route('/api/v1/charts/presence_calendar/<int:user_id>',
+           methods=['GET'])
+@jsonify
+def presence_calendar_chart_view(user_id):
+    """
+    Returns presence time in minutes of given user as DataTable.
+
+    Optional from and to query arguments (YYYY-MM-DD) limit the range.
+    Optional resolution query argument limits number of rows; days are
+    summed by week or month when the range has more of them, which is
+    told by 'bucket' table property. Days without presence are left out.
+    """
+    columns = [('date', 'Date'), ('number', 'Minutes')]
+    date_from = parse_date(request.args.get('from'))
+    date_to = parse_date(request.args.get('to'))
+    result = presence_calendar(user_id, date_from, date_to)
+    if result is None:
+        log.debug('User %s not found!', user_id)
+        return datatable(columns, [])
+
+    bucket, sums = calendar_buckets(
+        result[0], result[1], request.args.get('resolution', type=int)
+    )
+    table = datatable(columns, [
+        (date_value(day), minutes) for day, minutes in sums
+    ])
+    table['p'] = {'bucket': bucket}
+    return table
+
+
+@app.route('/admin/cache', methods=['GET'])
+@admin_required
+@jsonify
+def cache_view():
+    """
+    Returns state of presence data, users.xml and menu caches.
+    """
+    return cache_state()
+
+
+@app.route('/admin/cache/reload', methods=['POST'])
+@admin_required
+@jsonify
+def cache_reload_view():
+    """
+    Loads all cached files again and returns new cache state.
+    """
+    reload_caches()
+    return cache_state()
+
+
+@app.route('/admin/cache/flush', methods=['POST'])
+@admin_required
+@jsonify
+def cache_flush_view():
+    """
+    Drops all caches and returns new cache state.
+    """
+    flush_caches()
+    return cache_state()